@@ -36,6 +36,13 @@ class PolSAR():
     ''' PolSAR data
     Only accept .bin file with float data type, 'bsq' interleave 
     ATTENTION: Untested
+
+    The band files can be memory-mapped by `open()`, then the object can be
+    sliced like a [channel, height, width] array, only the pages covered by
+    the sliced window are read from disk, e.g.:
+
+        polsar = PolSAR(path).open()
+        patch = polsar[:, 1000:1512, 2000:2512]
     '''
     def __init__(self, path, data_format=None) -> None:
         self.path = path
@@ -43,6 +50,63 @@ class PolSAR():
         self.shape = self._get_shape()
         self.data = None
         self.storage_mode = None
+        self.bands = None
+
+    def open(self, mode='r'):
+        ''' Memory-map the band files lazily, no data is read here. The 
+        data type, byte order and header offset of the C3 and T3 bands come 
+        from their .bin.hdr files, and encoded folders are rejected
+
+        Args:
+            mode (str): mode of np.memmap, 'r', 'r+' or 'c'. Default: 'r'
+
+        Returns:
+            self
+        '''
+        meta_info = {'Nrow': self.shape[0], 'Ncol': self.shape[1]}
+        if self.data_format=='s2':
+            self.bands = psr.memmap_s2(self.path, meta_info=meta_info, mode=mode)
+        elif self.data_format=='C3':
+            self.bands = psr.memmap_c3(self.path, mode=mode)
+            self.storage_mode = 'save_space'
+        elif self.data_format=='T3':
+            self.bands = psr.memmap_t3(self.path, mode=mode)
+            self.storage_mode = 'save_space'
+        else:
+            raise NotImplementedError
+        return self
+
+    def close(self):
+        ''' Release the memory-mapped band files '''
+        self.bands = None
+
+    def __getitem__(self, key):
+        ''' Slice the memory-mapped data as if it is a [channel, height, 
+        width] array. A single channel returns a memmap view, otherwise only
+        the sliced window is stacked into a new array
+        '''
+        if self.bands is None:
+            self.open()
+        if not isinstance(key, tuple):
+            key = (key, )
+        ch, spatial = key[0], key[1:]
+
+        if isinstance(ch, (int, np.integer)):
+            return self.bands[ch][spatial]
+        elif isinstance(ch, slice):
+            bands = self.bands[ch]
+        else:
+            bands = [self.bands[ii] for ii in ch]
+
+        first = bands[0][spatial]
+        out = np.empty((len(bands), *first.shape), dtype=first.dtype)
+        out[0] = first
+        for ii, band in enumerate(bands[1:], start=1):
+            out[ii] = band[spatial]
+        return out
+
+    def __len__(self):
+        return len(BIN_FIELS[self.data_format])
 
     def read_data(self, is_print=True, storage_mode='save_space'):
         ''' Read PolSAR data 
@@ -75,78 +139,13 @@ class PolSAR():
         '''
 
         assert self.data_format in ('C3', 'T3')
+        if target_storage_mode not in psr.format_tables:
+            raise LookupError('wrong storage mode')
         if self.storage_mode == target_storage_mode:
-            return
-
-        # complex vector 6
-        if self.storage_mode == 'complex_vector_6':
-            if target_storage_mode == 'save_space':
-                c11 = self.data[0, :, :].real
-                c12_real = self.data[1, :, :].real
-                c12_img = self.data[1, :, :].imag
-                c13_real = self.data[2, :, :].real
-                c13_img = self.data[2, :, :].imag
-                c22 = self.data[3, :, :].real
-                c23_real = self.data[4, :, :].real
-                c23_img = self.data[4, :, :].imag
-                c33 = self.data[5, :, :].real
-                c3 = np.stack((c11, c12_real, c12_img, c13_real, c13_img, c22, c23_real, c23_img, c33), axis=0)
-            elif target_storage_mode == 'complex_vector_9':
-                c11 = self.data[0, :, :]
-                c12 = self.data[1, :, :]
-                c13 = self.data[2, :, :]
-                c22 = self.data[3, :, :]
-                c23 = self.data[4, :, :]
-                c33 = self.data[5, :, :]
-                c3 = np.stack((c11, c12, c13, c12.conj(), c22, c23, c13.conj(), c23.conj(), c33), axis=0)
-            else:
-                raise LookupError('wrong storage mode')
-
-        # complex_vector_9
-        elif self.storage_mode == 'complex_vector_9': 
-            if target_storage_mode == 'save_space':
-                c11 = self.data[0, :, :].real
-                c12_real = self.data[1, :, :].real
-                c12_img = self.data[1, :, :].imag
-                c13_real = self.data[2, :, :].real
-                c13_img = self.data[2, :, :].imag
-                c22 = self.data[4, :, :].real
-                c23_real = self.data[5, :, :].real
-                c23_img = self.data[5, :, :].imag
-                c33 = self.data[8, :, :].real
-                c3 = np.stack((c11, c12_real, c12_img, c13_real, c13_img, c22, c23_real, c23_img, c33), axis=0)
-            elif target_storage_mode == 'complex_vector_6':
-                c11 = self.data[0, :, :]
-                c12 = self.data[1, :, :]
-                c13 = self.data[2, :, :]
-                c22 = self.data[4, :, :]
-                c23 = self.data[5, :, :]
-                c33 = self.data[8, :, :]
-                c3 = np.stack((c11, c12, c13, c22, c23, c33), axis=0)
-            else:
-                raise LookupError('wrong out format')
-        
-        # save_space
-        elif self.storage_mode == 'save_space' :
-            if target_storage_mode == 'complex_vector_9':
-                c11 = self.data[0, :, :]
-                c12 = self.data[1, :, :] + 1j*self.data[2, :, :]
-                c13 = self.data[3, :, :] + 1j*self.data[4, :, :]
-                c22 = self.data[5, :, :]
-                c23 = self.data[6, :, :] + 1j*self.data[7, :, :]
-                c33 = self.data[8, :, :]
-                c3 = np.stack((c11, c12, c13, c12.conj(), c22, c23, c13.conj(), c23.conj(), c33), axis=0)
-            elif target_storage_mode == 'complex_vector_6':
-                c11 = self.data[0, :, :]
-                c12 = self.data[1, :, :] + 1j*self.data[2, :, :]
-                c13 = self.data[3, :, :] + 1j*self.data[4, :, :]
-                c22 = self.data[5, :, :]
-                c23 = self.data[6, :, :] + 1j*self.data[7, :, :]
-                c33 = self.data[8, :, :]
-                c3 = np.stack((c11, c12, c13,  c22, c23,  c33), axis=0)
-            else:
-                raise LookupError('wrong out format')
-        
+            return self.data
+
+        c3 = psr.as_format(self.data, target_storage_mode)
+
         if inplace:
             self.storage_mode = target_storage_mode
             self.data = c3
@@ -186,9 +185,9 @@ class PolSAR():
         R = np.abs(R)
         G = np.abs(G)
         B = np.abs(B)
-        R[R<np.finfo(float).eps] = np.finfo(float).eps
-        G[G<np.finfo(float).eps] = np.finfo(float).eps
-        B[B<np.finfo(float).eps] = np.finfo(float).eps
+        R[R<mathlib.eps] = mathlib.eps
+        G[G<mathlib.eps] = mathlib.eps
+        B[B<mathlib.eps] = mathlib.eps
 
         # logarithm 
         R = 10*np.log10(R)
@@ -223,31 +222,15 @@ class PolSAR():
                 raise NotImplementedError
 
     def _read_s2(self):
-        ''' Read S2 data in envi data type
+        ''' Read S2 data in envi data type, the interleaved float32 real and
+        imaginary parts are read into the complex64 buffer directly
 
         Returns:
             s2 (ndarray): complex64 data in [channel, height, width] shape
         '''
 
-        s11 = np.fromfile(osp.join(self.path, 's11.bin'), dtype=np.float32)
-        s12 = np.fromfile(osp.join(self.path, 's12.bin'), dtype=np.float32)
-        s21 = np.fromfile(osp.join(self.path, 's21.bin'), dtype=np.float32)
-        s22 = np.fromfile(osp.join(self.path, 's22.bin'), dtype=np.float32)
-
-        s11 = s11[0::2] + 1j*s11[1::2]
-        s12 = s12[0::2] + 1j*s12[1::2]
-        s21 = s21[0::2] + 1j*s21[1::2]
-        s22 = s22[0::2] + 1j*s22[1::2]
-
-        height = self.shape[0]
-        width = self.shape[1]
-        s11 = s11.reshape(height, width)
-        s12 = s12.reshape(height, width)
-        s21 = s21.reshape(height, width)
-        s22 = s22.reshape(height, width)
-
-        s2 = np.stack((s11, s12, s21, s22), axis=0)
-        return s2
+        meta_info = {'Nrow': self.shape[0], 'Ncol': self.shape[1]}
+        return psr.read_s2(self.path, meta_info=meta_info)
     
     def _read_c3(self):
         ''' Read C3 data in envi data type
@@ -260,7 +243,7 @@ class PolSAR():
         height = self.shape[0]
         width = self.shape[1]
         
-        c3 = np.empty(9, height, width)
+        c3 = np.empty((9, height, width), dtype=np.float32)
         for ii, bin in enumerate(BIN_FIELS['C3']):
             c3[ii, ...] = np.fromfile(osp.join(self.path, bin), dtype=np.float32).reshape(height, width)
 
@@ -6,6 +6,7 @@ Last Modified: 2021-05-21
 '''
 import os
 import os.path as osp
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 def mkdir_if_not_exist(path):  
     """Make a directory if it does not exist."""
@@ -33,4 +34,34 @@ def read_file_as_list(path):
             if line:
                 contents.append(line)
     
-    return contents
\ No newline at end of file
+    return contents
+
+
+def scan_dir(path):
+    ''' scan a single directory with os.scandir, return its path, mtime, file names and sub directories '''
+    files, subdirs = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            else:
+                files.append(entry.name)
+    return path, os.stat(path).st_mtime_ns, files, subdirs
+
+
+def scan_tree(path, num_workers=8):
+    ''' walk a directory tree with os.scandir in parallel threads
+    @in     -path           -root of the tree
+            -num_workers    -number of threads
+    @ret    -dict of {directory path: (mtime_ns, file names)}, for all the directories in the tree
+    '''
+    tree = {}
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = {pool.submit(scan_dir, path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_path, mtime, files, subdirs = future.result()
+                tree[dir_path] = (mtime, files)
+                pending.update(pool.submit(scan_dir, sub) for sub in subdirs)
+    return tree
@@ -5,10 +5,74 @@ Last Modified: 2021-05-30
 	content: functions about general math
 '''
 
+import warnings
+from contextlib import contextmanager
 import numpy as np
 from numpy import ndarray
 
-eps = np.finfo(float).eps
+# python float, so it does not promote float32 arrays to float64
+eps = float(np.finfo(float).eps)
+
+# floating point precision of the arrays created by the library, 'single' 
+# for float32 and complex64, 'double' for float64 and complex128
+float_precision = 'single'
+
+
+def set_precision(precision:str):
+    ''' Set the library-wide floating point precision
+
+    Args:
+        precision (str): 'single' or 'double'
+    '''
+    global float_precision
+    if precision not in ('single', 'double'):
+        raise ValueError(f'unsupported precision: {precision}')
+    float_precision = precision
+
+
+@contextmanager
+def precision(value:str):
+    ''' Context manager to change the floating point precision temporarily,
+    e.g. with mathlib.precision('double'): ...
+    '''
+    old = float_precision
+    set_precision(value)
+    try:
+        yield
+    finally:
+        set_precision(old)
+
+
+def real_dtype():
+    ''' Real data type of the current precision '''
+    return np.dtype(np.float32 if float_precision=='single' else np.float64)
+
+
+def complex_dtype():
+    ''' Complex data type of the current precision '''
+    return np.dtype(np.complex64 if float_precision=='single' else np.complex128)
+
+
+def float_dtype(dtype, is_complex=False):
+    ''' Data type of the results computed from data of "dtype", float data
+    keeps its precision unless the current precision is higher, other data
+    uses the current precision
+
+    Args:
+        dtype: data type of the input data
+        is_complex (bool): if to return the complex data type. Default: 
+            False
+    '''
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.complexfloating):
+        dtype = np.finfo(dtype).dtype
+    if np.issubdtype(dtype, np.floating):
+        dtype = np.result_type(dtype, real_dtype())
+    else:
+        dtype = real_dtype()
+    if is_complex:
+        dtype = np.result_type(dtype, np.complex64)
+    return dtype
 
 def var_with_known_mean(data: ndarray, mean: ndarray, axis, ddof: int) -> ndarray:
     ''' Calculate variance with known mean value 
@@ -80,10 +144,12 @@ def norm_3_sigma(data:np.ndarray, mean=None, std=None, type='complex'):
     else:
         raise NotImplementedError
 
+    # statistics are accumulated in the current precision
+    dtype = float_dtype(tmp.dtype, is_complex=np.iscomplexobj(tmp))
     if mean is None:
-        mean = tmp.mean(axis=(-1, -2), keepdims=True)
+        mean = tmp.mean(axis=(-1, -2), keepdims=True, dtype=dtype)
     if std is None: 
-        std = tmp.std(axis=(-1, -2), keepdims=True)
+        std = tmp.std(axis=(-1, -2), keepdims=True, dtype=dtype)
     ret /= (mean+3*std)
     ret_abs = np.abs(ret)
     ret_abs[ret_abs<1] = 1
@@ -101,18 +167,25 @@ def mat_mul_dot(a: ndarray, b: ndarray) -> ndarray:
 
     
 
-def min_max_contrast_median(data:np.ndarray, mask=None):
+def min_max_contrast_median(data:np.ndarray, mask=None, axis=None):
     ''' Use the iterative method to get special min and max value
 
     Args:
         data (ndaray): data to be processed
         mask (ndarray): mask for the valid pixel, 1 indicates valid, 0 
             indicates invalid, None indicats all valid. Default: None
+        axis (None or int or tuple of ints): axes along which the min and
+            max value are computed, e.g. (-2, -1) for a batch of images, 
+            None means over the whole data. Default: None
 
     Returns:
-        min and max value in a tuple
+        min and max value in a tuple, if "axis" is not None, they keep the
+        reduced dimensions
     '''
     
+    if axis is not None:
+        return min_max_contrast_median_axis(data, mask=mask, axis=axis)
+
     if mask is not None:
         data = data[mask]
 
@@ -139,7 +212,31 @@ def min_max_contrast_median(data:np.ndarray, mask=None):
     return med1, med2
 
 
-def min_max_contrast_median_map(data:np.ndarray, mask=None, is_print=False)->np.ndarray:
+def min_max_contrast_median_axis(data:np.ndarray, mask=None, axis=(-2, -1)):
+    ''' Vectorized min_max_contrast_median() along the given axes, the 
+    invalid pixels are set to nan and skipped by np.nanmedian() '''
+
+    valid = np.isfinite(data)
+    if mask is not None:
+        valid &= mask.astype(bool)
+    data = np.where(valid, data, np.nan)
+
+    with warnings.catch_warnings():
+        # all-nan slices keep the previous value
+        warnings.simplefilter('ignore', RuntimeWarning)
+        med = np.nanmedian(data, axis=axis, keepdims=True)
+        med1 = med.copy()       # the minimum value
+        med2 = med.copy()       # the maximum value
+        for ii in range(3):
+            part_min = np.nanmedian(np.where(data<med1, data, np.nan), axis=axis, keepdims=True)
+            med1 = np.where(np.isnan(part_min), med1, part_min)
+        for ii in range(3):
+            part_max = np.nanmedian(np.where(data>med2, data, np.nan), axis=axis, keepdims=True)
+            med2 = np.where(np.isnan(part_max), med2, part_max)
+    return med1, med2
+
+
+def min_max_contrast_median_map(data:np.ndarray, mask=None, is_print=False, axis=None)->np.ndarray:
     '''Map all the elements of x into [0,1] using min_max_contrast_median function
 
     Args:
@@ -147,11 +244,13 @@ def min_max_contrast_median_map(data:np.ndarray, mask=None, is_print=False)->np.
         mask (ndarray): mask for the valid pixel, 1 indicates valid, 0 
             indicates invalid, None indicats all valid. Default: None
         is_print (bool): whether to print debug infos
+        axis (None or int or tuple of ints): same usage as 
+            min_max_contrast_median(). Default: None
 
     Returns:
         the nomalized np.ndarray
     '''
-    min, max = min_max_contrast_median(data, mask=mask)
+    min, max = min_max_contrast_median(data, mask=mask, axis=axis)
     if is_print:
         print(f'min: {min}, max: {max}')
     return np.clip((data-min)/(max - min), a_min=0, a_max=1)
@@ -7,7 +7,12 @@ Last Modified: 2021-07-05
 
 import os
 import os.path as osp
+import sys
 import math
+import shutil
+import uuid
+import queue
+import threading
 
 import numpy as np 
 from matplotlib import pyplot as plt 
@@ -18,7 +23,13 @@ import torch
 from glob import glob
 import xml.etree.ElementTree as et
 import re
+import json
+import struct
+import zlib
+import lzma
 import tifffile
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 
 from mylib import file_utils as fu
 from mylib import image_utils as iu
@@ -36,9 +47,142 @@ t3_bin_files = ['T11.bin', 'T12_real.bin', 'T12_imag.bin', 'T13_real.bin',
 
 s2_bin_files = ['s11.bin', 's12.bin', 's21.bin', 's22.bin']
 
-hdr_elements = ['samples', 'lines', 'byte order', 'data type', 'interleave']
+HAalpha_bin_files = ['entropy.bin', 'anisotropy.bin', 'alpha.bin']
+
+# ENVI data type codes, data_type[code-1] is the corresponding numpy dtype
+data_type = ['uint8', 'int16', 'int32', 'float32', 'float64', 'complex64', 
+            None, None, 'complex128', None, None, 'uint16', 'uint32', 'int64',
+            'uint64']
+
+chunk_magic = b'PSRCHUNK'
+
+# compress and decompress functions of the chunked file
+chunk_compressors = {
+    None: (lambda buf, level: buf, lambda buf: buf),
+    'zlib': (lambda buf, level: zlib.compress(buf, level), zlib.decompress),
+    'lzma': (lambda buf, level: lzma.compress(buf, preset=level), lzma.decompress),
+    }
+
+class ReadCache():
+    ''' LRU cache of the headers and data read from disk, the keys contain
+    the path, modification time and size of the files, so that a modified
+    file is never served from the cache. Cached arrays are read-only
+
+    Args:
+        max_bytes (int): byte-size budget of the cached values, the least
+            recently used values are evicted when it is exceeded. Default: 
+            2**30
+    '''
+
+    def __init__(self, max_bytes=2**30) -> None:
+        self.max_bytes = max_bytes
+        self.values = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        ''' Get the cached value, None if not cached '''
+        with self.lock:
+            if key in self.values:
+                self.values.move_to_end(key)
+                self.hits += 1
+                return self.values[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        ''' Cache a value, values larger than the budget are not cached '''
+        if isinstance(value, ndarray):
+            value.flags.writeable = False
+            nbytes = value.nbytes
+        else:
+            nbytes = sys.getsizeof(value)
+        if nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.values:
+                self.nbytes -= self.values.pop(key)[1]
+            self.values[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self.values.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        ''' Remove all the cached values, and reset the counters '''
+        with self.lock:
+            self.values.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self)->dict:
+        ''' Get the hit/miss counters and the memory usage '''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 
+                    'evictions': self.evictions, 'entries': len(self.values),
+                    'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+
+# cache of read_hdr(), read_s2_config(), read_c3(), read_t3() and read_s2(), 
+# disabled by default
+read_cache = None
+
+
+def enable_read_cache(max_bytes=2**30)->ReadCache:
+    ''' Enable the cache of the readers, repeated reads of the same
+    unmodified files are served from memory. Arrays returned from the cache
+    are read-only, copy them before modifying in place
+
+    Args:
+        max_bytes (int): byte-size budget of the cache. Default: 2**30
+
+    Returns:
+        the enabled cache
+    '''
+    global read_cache
+    read_cache = ReadCache(max_bytes)
+    return read_cache
+
+
+def disable_read_cache():
+    ''' Disable and release the cache of the readers '''
+    global read_cache
+    read_cache = None
+
+
+def files_stamp(path:str, files)->tuple:
+    ''' Get the (path, mtime, size) stamp of files, used as a cache key '''
+    stamp = []
+    for file in files:
+        file = osp.abspath(osp.join(path, file))
+        st = os.stat(file)
+        stamp.append((file, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def cached_read(make_key, read):
+    ''' Call read() through the read cache if it is enabled
+
+    Args:
+        make_key (callable): function returns the cache key, only called if
+            the cache is enabled
+        read (callable): function reads the value
+    '''
+    cache = read_cache
+    if cache is None:
+        return read()
+    key = make_key()
+    value = cache.get(key)
+    if value is None:
+        value = read()
+        cache.put(key, value)
+    return value
 
-data_type = ['uint8', 'int16', 'int32', 'float32', 'float64', 'uint16', 'uint32', 'int64', 'uint64']
 
 def check_c3_path(path:str)->str:
     '''check the path whether contains the c3 folder, if not, add it'''
@@ -58,38 +202,190 @@ def check_s2_path(path:str)->str:
 def read_s2_config(path:str)->dict:
     ''' read header file of S2 file'''
     path = check_s2_path(path)
-    s2_info = dict()
-    with open(osp.join(path, 'config.txt'), 'r') as f:
-        for ii in range(4):
-            key = f.readline().strip()
-            value = f.readline().strip()
-            s2_info[key] = value
-            f.readline()
-    return s2_info
+
+    def read():
+        s2_info = dict()
+        with open(osp.join(path, 'config.txt'), 'r') as f:
+            for ii in range(4):
+                key = f.readline().strip()
+                value = f.readline().strip()
+                s2_info[key] = value
+                f.readline()
+        return s2_info
+
+    return dict(cached_read(lambda: ('config', files_stamp(path, ['config.txt'])), read))
 
 
 def read_hdr(path:str, file='C11.bin')->dict:
-    ''' Read header file of C3 file
+    ''' Read ENVI header file, all the fields are kept as strings, keys are
+    in lower case, and values in braces, which may span multiple lines, are
+    kept without the braces
     
     Args:
         path (str): path to the hdr file
         file (str): from whom the header file will be readed
     '''
     # path = check_c3_path(path)
-    meta_info = dict()
-    with open(os.path.join(path, file+'.hdr'), 'r') as hdr:
-        for line in hdr:
-            # print(line)
-            sp = line.split('=')
-            if len(sp)==2:
-                ky, val = sp   
-                ky = ky.strip()
+    def read():
+        meta_info = dict()
+        with open(os.path.join(path, file+'.hdr'), 'r') as hdr:
+            for line in hdr:
+                if '=' not in line:
+                    continue
+                ky, val = line.split('=', 1)
+                ky = ky.strip().lower()
                 val = val.strip()
-                # print(ky, ky in elements)
-                if ky in hdr_elements:
-                    meta_info[ky] = val
-        # print(meta_info)
-    return meta_info
+                if val.startswith('{'):
+                    while not val.endswith('}'):
+                        next_line = next(hdr, None)
+                        if next_line is None:
+                            raise IOError(f'unclosed brace of "{ky}" in {file}.hdr')
+                        val += ' ' + next_line.strip()
+                    val = val[1:-1].strip()
+                meta_info[ky] = val
+        return meta_info
+
+    return dict(cached_read(lambda: ('hdr', files_stamp(path, [file+'.hdr'])), read))
+
+
+def get_envi_dtype(meta_info:dict)->np.dtype:
+    ''' Get the numpy dtype from ENVI header, including the byte order
+
+    Args:
+        meta_info (dict): meta info contains the .bin.hdr information
+
+    Returns:
+        dtype (np.dtype): data type, big-endian if "byte order" is 1
+    '''
+    code = int(meta_info['data type'])
+    if code<1 or code>len(data_type) or data_type[code-1] is None:
+        raise NotImplementedError(f'unsupported ENVI data type: {code}')
+    dtype = np.dtype(data_type[code-1])
+    byte_order = '>' if int(meta_info.get('byte order', 0)) == 1 else '<'
+    return dtype.newbyteorder(byte_order)
+
+
+def get_envi_byte_order(dtype)->str:
+    ''' Get the ENVI "byte order" of the data type, 1 for big-endian '''
+    dtype = np.dtype(dtype)
+    if dtype.byteorder == '>' or (dtype.byteorder == '=' and sys.byteorder == 'big'):
+        return '1'
+    return '0'
+
+
+def memmap_envi(file:str, meta_info=None, mode='r')->np.memmap:
+    ''' Memory-map an ENVI binary file as a [bands, lines, samples] view. 
+    'bsq', 'bil' and 'bip' interleaves, header offset, big-endian and complex
+    data are handled by dtype and stride views, no data is converted or
+    copied
+
+    Args:
+        file (str): path to the binary file
+        meta_info (dict): meta info of the .hdr file, None means reading it
+            from file+'.hdr'. Default: None
+        mode (str): mode of np.memmap. Default: 'r'
+
+    Returns:
+        np.memmap view in [bands, lines, samples] shape
+    '''
+    if meta_info is None:
+        meta_info = read_hdr(osp.dirname(file), file=osp.basename(file))
+    bands = int(meta_info.get('bands', 1))
+    lines = int(meta_info['lines'])
+    samples = int(meta_info['samples'])
+    interleave = meta_info.get('interleave', 'bsq').lower()
+    kwargs = dict(dtype=get_envi_dtype(meta_info), mode=mode, offset=int(meta_info.get('header offset', 0)))
+
+    if interleave == 'bsq':
+        return np.memmap(file, shape=(bands, lines, samples), **kwargs)
+    elif interleave == 'bil':
+        return np.memmap(file, shape=(lines, bands, samples), **kwargs).transpose(1, 0, 2)
+    elif interleave == 'bip':
+        return np.memmap(file, shape=(lines, samples, bands), **kwargs).transpose(2, 0, 1)
+    else:
+        raise NotImplementedError(f'unrecognized interleave: {interleave}')
+
+
+def memmap_bins(path:str, bin_files:list, shape, dtype=np.float32, mode='r', offset=0)->list:
+    ''' Memory-map a set of single band ENVI binary files, no data is read
+    until a window of the returned arrays is sliced
+
+    Args:
+        path (str): folder of the binary files
+        bin_files (list): names of the binary files
+        shape (tuple): spatial shape of each band, in [height, width] format
+        dtype (np.dtype): data type of the binary files. Default: np.float32
+        mode (str): mode of np.memmap, 'r', 'r+' or 'c'. Default: 'r'
+        offset (int): header offset in bytes. Default: 0
+
+    Returns:
+        list of np.memmap, each in [height, width] shape
+    '''
+    return [np.memmap(osp.join(path, bin), dtype=dtype, mode=mode, shape=tuple(shape), offset=offset) for bin in bin_files]
+
+
+def memmap_c3(path:str, meta_info=None, mode='r')->list:
+    ''' Memory-map C3 data in envi data type
+
+    Args:
+        path (str): path to C3 data
+        meta_info (dict): meta info contains the .bin.hdr information.
+            Default: None
+        mode (str): mode of np.memmap. Default: 'r'
+
+    Returns:
+        list of 9 np.memmap in 'save_space' order, each in [height, width]
+        shape
+    '''
+    path = check_c3_path(path)
+    if meta_info is None:
+        meta_info = read_hdr(path)
+    if 'polsar encoding' in meta_info:
+        raise NotImplementedError('encoded data can not be memory-mapped, use read_c3() instead')
+    shape = (int(meta_info['lines']), int(meta_info['samples']))
+    return memmap_bins(path, c3_bin_files, shape, dtype=get_envi_dtype(meta_info), mode=mode, offset=int(meta_info.get('header offset', 0)))
+
+
+def memmap_t3(path:str, meta_info=None, mode='r')->list:
+    ''' Memory-map T3 data in envi data type
+
+    Args:
+        path (str): path to T3 data
+        meta_info (dict): meta info contains the .bin.hdr information.
+            Default: None
+        mode (str): mode of np.memmap. Default: 'r'
+
+    Returns:
+        list of 9 np.memmap in 'save_space' order, each in [height, width]
+        shape
+    '''
+    if meta_info is None:
+        meta_info = read_hdr(path, file='T11.bin')
+    if 'polsar encoding' in meta_info:
+        raise NotImplementedError('encoded data can not be memory-mapped, use read_t3() instead')
+    shape = (int(meta_info['lines']), int(meta_info['samples']))
+    return memmap_bins(path, t3_bin_files, shape, dtype=get_envi_dtype(meta_info), mode=mode, offset=int(meta_info.get('header offset', 0)))
+
+
+def memmap_s2(path:str, meta_info=None, mode='r')->list:
+    ''' Memory-map S2 data in envi data type, the interleaved float32 real
+    and imaginary parts are viewed as complex64 directly
+
+    Args:
+        path (str): path to S2 data
+        meta_info (dict): meta info contains the config.txt information.
+            Default: None
+        mode (str): mode of np.memmap. Default: 'r'
+
+    Returns:
+        list of 4 complex64 np.memmap, i.e. s11, s12, s21, s22, each in
+        [height, width] shape
+    '''
+    path = check_s2_path(path)
+    if meta_info is None:
+        meta_info = read_s2_config(path)
+    shape = (int(meta_info['Nrow']), int(meta_info['Ncol']))
+    return memmap_bins(path, s2_bin_files, shape, dtype=np.complex64, mode=mode)
 
 
 def read_HAalpha(path):
@@ -105,14 +401,97 @@ def read_HAalpha(path):
     assert osp.isdir(path), 'Wrong folder path'
 
     meta_info = read_hdr(path, file='alpha.bin')
-    H = np.fromfile(osp.join(path, 'entropy.bin'), dtype=data_type[int(meta_info['data type'])-1]).reshape(int(meta_info['lines']), int(meta_info['samples']))
-    A = np.fromfile(osp.join(path, 'anisotropy.bin'), dtype=data_type[int(meta_info['data type'])-1]).reshape(int(meta_info['lines']), int(meta_info['samples']))
-    alpha = np.fromfile(osp.join(path, 'alpha.bin'), dtype=data_type[int(meta_info['data type'])-1]).reshape(int(meta_info['lines']), int(meta_info['samples']))
+    samples = int(meta_info['samples'])
+    window = check_window(None, (int(meta_info['lines']), samples))
+    HAalpha = np.empty((3, window[2], window[3]), dtype=get_envi_dtype(meta_info))
+    read_bins_window(path, HAalpha_bin_files, HAalpha, window, samples, offset=int(meta_info.get('header offset', 0)))
+
+    return HAalpha
+
+
+def check_window(window, shape)->tuple:
+    ''' Check the window of a partial read, and fill it if it is None
+
+    Args:
+        window (tuple or None): in the form of (row0, col0, h, w), None means
+            the whole image
+        shape (tuple): shape of the whole image, in [height, width] format
+
+    Returns:
+        window (tuple): checked window in the form of (row0, col0, h, w)
+    '''
+    if window is None:
+        return (0, 0, int(shape[0]), int(shape[1]))
+
+    row0, col0, h, w = [int(ii) for ii in window]
+    if row0<0 or col0<0 or h<=0 or w<=0 or row0+h>shape[0] or col0+w>shape[1]:
+        raise ValueError(f'window {window} exceeds the image of shape {tuple(shape)}')
+    return (row0, col0, h, w)
+
+
+def read_bin_window(file:str, out:ndarray, window, samples:int, offset=0)->ndarray:
+    ''' Read a window of a single band ENVI binary file into a preallocated
+    array, only the rows (or row spans) covered by the window are read
+
+    Args:
+        file (str): path to the binary file
+        out (ndarray): C-contiguous array in [h, w] shape, whose data type is
+            the same as the binary file
+        window (tuple): in the form of (row0, col0, h, w)
+        samples (int): width of the whole image
+        offset (int): header offset in bytes. Default: 0
+
+    Returns:
+        out (ndarray): the filled array
+    '''
+    row0, col0, h, w = window
+    itemsize = out.itemsize
+    with open(file, 'rb') as f:
+        if col0 == 0 and w == samples:
+            # continuous rows, read at once
+            f.seek(offset + row0*samples*itemsize)
+            nbytes = f.readinto(out)
+            if nbytes != out.nbytes:
+                raise IOError(f'{file} is too short for window {window}')
+        else:
+            for ii in range(h):
+                f.seek(offset + ((row0+ii)*samples + col0)*itemsize)
+                nbytes = f.readinto(out[ii])
+                if nbytes != w*itemsize:
+                    raise IOError(f'{file} is too short for window {window}')
+    return out
+
+
+def read_bins_window(path:str, bin_files:list, out:ndarray, window, samples:int, offset=0, num_workers=0)->ndarray:
+    ''' Read a window of several single band ENVI binary files into the
+    slices of a preallocated [channel, h, w] array
+
+    Args:
+        path (str): folder of the binary files
+        bin_files (list): names of the binary files, one for each channel
+        out (ndarray): C-contiguous array in [channel, h, w] shape
+        window (tuple): in the form of (row0, col0, h, w)
+        samples (int): width of the whole image
+        offset (int): header offset in bytes. Default: 0
+        num_workers (int): number of threads to read the band files at the
+            same time, 0 means reading them one after another. Default: 0
 
-    return np.stack((H, A, alpha), axis=0)
+    Returns:
+        out (ndarray): the filled array
+    '''
+    if num_workers > 0:
+        # file reads release the GIL
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            futures = [pool.submit(read_bin_window, osp.join(path, bin), out[ii], window, samples, offset) for ii, bin in enumerate(bin_files)]
+            for future in futures:
+                future.result()
+    else:
+        for ii, bin in enumerate(bin_files):
+            read_bin_window(osp.join(path, bin), out[ii], window, samples, offset=offset)
+    return out
 
 
-def read_c3(path:str, out:str='complex_vector_6', meta_info=None, count=-1, offset=0, is_print=False)->np.ndarray:
+def read_c3(path:str, out:str='complex_vector_6', meta_info=None, count=-1, offset=0, is_print=False, window=None, num_workers=0)->np.ndarray:
     ''' read C3 data in envi data type
     @in      -path       -path to C3 data
     @in      -out        -output format, if is 'save_space',  the last dimension of the output is the channel 
@@ -122,8 +501,10 @@ def read_c3(path:str, out:str='complex_vector_6', meta_info=None, count=-1, offs
                         if is 'complex_vector_6', then the last dimension is organized as c11, c12, c13, c22, c23, 
                         c33, cause the covariance matrix is conjugate symmeitric
             -meta_info  - meta info contains the .bin.hdr information
-            -count      -Number of items to read. -1 means all items (i.e., the complete file).
-            -offset     -The offset (in bytes) from the files current position. 
+            -count      -deprecated, only -1 is supported, use "window" to read a part of the image
+            -offset     -The offset (in bytes) from the start of the files, besides the header offset. 
+            -window     -(row0, col0, h, w) of the part to be read, None means the whole image
+            -num_workers -number of threads to read the band files at the same time, 0 means sequentially
     @out     -C3 data in the specified format, 3-D matrix shape of [channel x height x width]
     '''
 
@@ -134,61 +515,70 @@ def read_c3(path:str, out:str='complex_vector_6', meta_info=None, count=-1, offs
 
     if meta_info is None:
         meta_info = read_hdr(path)
+    if count != -1:
+        raise ValueError('"count" can not read a part of the image, use "window" instead')
 
-    # read binary files
-    c11 = np.fromfile(os.path.join(path, 'C11.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c11 = c11.reshape(int(meta_info['lines']), int(meta_info['samples']))
+    if out not in ('save_space', 'complex_vector_9', 'complex_vector_6'):
+        raise LookupError('wrong output format')
 
-    # print(os.path.join(path, 'C12_real.bin'))
-    c12_real = np.fromfile(os.path.join(path, 'C12_real.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c12_real = c12_real.reshape(int(meta_info['lines']), int(meta_info['samples']))
-    
-    c12_img = np.fromfile(os.path.join(path, 'C12_imag.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c12_img = c12_img.reshape(int(meta_info['lines']), int(meta_info['samples']))
-    
-    c13_real = np.fromfile(os.path.join(path, 'C13_real.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c13_real = c13_real.reshape(int(meta_info['lines']), int(meta_info['samples']))
-    
-    c13_img = np.fromfile(os.path.join(path, 'C13_imag.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c13_img = c13_img.reshape(int(meta_info['lines']), int(meta_info['samples']))
+    # normalized window, which is hashable as a cache key
+    window = check_window(window, (int(meta_info['lines']), int(meta_info['samples'])))
 
-    c22 = np.fromfile(os.path.join(path, 'C22.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c22 = c22.reshape(int(meta_info['lines']), int(meta_info['samples']))
-    
-    c23_real = np.fromfile(os.path.join(path, 'C23_real.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c23_real = c23_real.reshape(int(meta_info['lines']), int(meta_info['samples']))
-    
-    c23_img = np.fromfile(os.path.join(path, 'C23_imag.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c23_img = c23_img.reshape(int(meta_info['lines']), int(meta_info['samples']))
-    
-    c33 = np.fromfile(os.path.join(path, 'C33.bin'), dtype=data_type[int(meta_info['data type'])-1], count=count, offset=offset)
-    c33 = c33.reshape(int(meta_info['lines']), int(meta_info['samples']))
-
-    # constructe to the specified data format
-    if out == 'save_space':
-        c3 = np.stack((c11, c12_real, c12_img, c13_real, c13_img, c22, c23_real, c23_img, c33), axis=0)
-    elif out == 'complex_vector_9':
-        c12 = c12_real + 1j*c12_img
-        c13 = c13_real + 1j*c13_img
-        c23 = c23_real + 1j*c23_img
-        c3 = np.stack((c11, c12, c13, c12.conj(), c22, c23, c13.conj(), c23.conj(), c33), axis=0)
-    elif out == 'complex_vector_6':
-        c12 = c12_real + 1j*c12_img
-        c13 = c13_real + 1j*c13_img
-        c23 = c23_real + 1j*c23_img
-        c3 = np.stack((c11, c12, c13,  c22, c23,  c33), axis=0)
-    else:
-        raise LookupError('wrong output format')
-    return c3
+    def read():
+        # read binary files into a preallocated buffer
+        c3 = read_envi_bins(path, c3_bin_files, meta_info, window=window, offset=offset, num_workers=num_workers)
+
+        # the file precision is kept unless the precision policy is higher
+        c3 = c3.astype(mathlib.float_dtype(c3.dtype), copy=False)
+
+        # constructe to the specified data format
+        return as_format(c3, out=out)
+
+    return cached_read(lambda: ('c3', files_stamp(path, c3_bin_files), tuple(meta_info.items()), window, offset, out, mathlib.float_precision), read)
+
+
+def read_t3(path:str, out:str='complex_vector_6', meta_info=None, is_print=False, window=None, num_workers=0)->np.ndarray:
+    ''' Read T3 data in envi data type
+
+    Args:
+        path (str): path to T3 data
+        out (str): output format, 'save_space' or 'complex_vector_6' or
+            'complex_vector_9', see read_c3(). Default: 'complex_vector_6'
+        meta_info (dict): meta info contains the .bin.hdr information.
+            Default: None
+        is_print (bool): whether to print the debug info. Default: False
+        window (tuple or None): in the form of (row0, col0, h, w), None means
+            the whole image. Default: None
+        num_workers (int): number of threads to read the band files at the
+            same time. Default: 0
+
+    Returns:
+        T3 data in the specified format, in [channel, height, width] shape
+    '''
+    if is_print:
+        print('reading from ', path)
 
+    if meta_info is None:
+        meta_info = read_hdr(path, file='T11.bin')
+    window = check_window(window, (int(meta_info['lines']), int(meta_info['samples'])))
+
+    def read():
+        t3 = read_envi_bins(path, t3_bin_files, meta_info, window=window, num_workers=num_workers)
+        t3 = t3.astype(mathlib.float_dtype(t3.dtype), copy=False)
+        return as_format(t3, out=out)
+
+    return cached_read(lambda: ('t3', files_stamp(path, t3_bin_files), tuple(meta_info.items()), window, out, mathlib.float_precision), read)
 
-def read_s2(path:str, meta_info=None, count=-1, offset=0, is_print=None)->np.ndarray:
+
+def read_s2(path:str, meta_info=None, count=-1, offset=0, is_print=None, window=None, num_workers=0)->np.ndarray:
     ''' read S2 data in envi data type
     @in      -path       -path to S2 data
     @in     -meta_info  - meta info contains the .bin.hdr information
-            -count      -Number of items to read. -1 means all items (i.e., the complete file).
-            -offset     -The offset (in bytes) from the files current position. 
-    @out     -S2 data in the torch.complex64 format, 3-D matrix shape of [channel x height x width]
+            -count      -deprecated, only -1 is supported, use "window" to read a part of the image
+            -offset     -The offset (in bytes) from the start of the files. 
+            -window     -(row0, col0, h, w) of the part to be read, None means the whole image
+            -num_workers -number of threads to read the band files at the same time, 0 means sequentially
+    @out     -S2 data in the np.complex64 format (complex128 under the double precision policy), 3-D matrix shape of [channel x height x width]
     '''
     path = check_s2_path(path)
     if is_print:
@@ -196,34 +586,156 @@ def read_s2(path:str, meta_info=None, count=-1, offset=0, is_print=None)->np.nda
 
     if meta_info is None:
         meta_info = read_s2_config(path)
+    if count != -1:
+        raise ValueError('"count" can not read a part of the image, use "window" instead')
+    samples = int(meta_info['Ncol'])
+    window = check_window(window, (int(meta_info['Nrow']), samples))
+
+    def read():
+        # interleaved float32 real and imaginary parts are read as complex64 
+        s2 = np.empty((4, window[2], window[3]), dtype=np.complex64)
+        read_bins_window(path, s2_bin_files, s2, window, samples, offset=offset, num_workers=num_workers)
+        return s2.astype(mathlib.float_dtype(s2.dtype, is_complex=True), copy=False)
+
+    return cached_read(lambda: ('s2', files_stamp(path, s2_bin_files), tuple(meta_info.items()), window, offset, mathlib.float_precision), read)
 
-    s11 = np.fromfile(osp.join(path, 's11.bin'), dtype=np.float32, count=count, offset=offset)
-    s12 = np.fromfile(osp.join(path, 's12.bin'), dtype=np.float32, count=count, offset=offset)
-    s21 = np.fromfile(osp.join(path, 's21.bin'), dtype=np.float32, count=count, offset=offset)
-    s22 = np.fromfile(osp.join(path, 's22.bin'), dtype=np.float32, count=count, offset=offset)
 
-    s11 = s11[0::2] + 1j*s11[1::2]
-    s12 = s12[0::2] + 1j*s12[1::2]
-    s21 = s21[0::2] + 1j*s21[1::2]
-    s22 = s22[0::2] + 1j*s22[1::2]
+def read_tiff_window(tif:str, window=None)->ndarray:
+    ''' Read a window of the first page of a tiff file. Uncompressed tiff is
+    memory-mapped, otherwise only the tiles or strips covered by the window
+    are read and decoded
 
-    height = int(meta_info['Nrow'])
-    weight = int(meta_info['Ncol'])
-    s11 = s11.reshape(height, weight)
-    s12 = s12.reshape(height, weight)
-    s21 = s21.reshape(height, weight)
-    s22 = s22.reshape(height, weight)
+    Args:
+        tif (str): path to the tiff file
+        window (tuple or None): in the form of (row0, col0, h, w), None means
+            the whole image. Default: None
+
+    Returns:
+        data in [sample, h, w] shape, which is a memmap view if the tiff
+        file is memory-mappable
+    '''
+    with tifffile.TiffFile(tif) as tf:
+        page = tf.pages[0]
+        height, width = page.imagelength, page.imagewidth
+        samples = page.samplesperpixel
+        separate = page.planarconfig == tifffile.PLANARCONFIG.SEPARATE
+        row0, col0, h, w = check_window(window, (height, width))
+
+        if not page.is_memmappable:
+            if page.is_tiled:
+                seg_het, seg_wes = page.tilelength, page.tilewidth
+            else:
+                seg_het, seg_wes = min(page.rowsperstrip, height), width
+            n_y = math.ceil(height/seg_het)
+            n_x = math.ceil(width/seg_wes)
+            indices = [plane*n_y*n_x + ty*n_x + tx 
+                        for plane in range(samples if separate else 1)
+                        for ty in range(row0//seg_het, (row0+h-1)//seg_het+1)
+                        for tx in range(col0//seg_wes, (col0+w-1)//seg_wes+1)]
+
+            out = np.empty((samples, h, w), dtype=page.dtype)
+            offsets = [page.dataoffsets[ii] for ii in indices]
+            bytecounts = [page.databytecounts[ii] for ii in indices]
+            for data, idx in tf.filehandle.read_segments(offsets, bytecounts, indices=indices):
+                # segment in (depth, length, width, contig sample) shape
+                segment, (plane, _, ys, xs, _), _ = page.decode(data, idx, jpegtables=page.jpegtables)
+                segment = segment[0].transpose(2, 0, 1)
+                y0, y1 = max(ys, row0), min(ys+segment.shape[1], row0+h)
+                x0, x1 = max(xs, col0), min(xs+segment.shape[2], col0+w)
+                if separate:
+                    out[plane, y0-row0:y1-row0, x0-col0:x1-col0] = segment[0, y0-ys:y1-ys, x0-xs:x1-xs]
+                else:
+                    out[:, y0-row0:y1-row0, x0-col0:x1-col0] = segment[:, y0-ys:y1-ys, x0-xs:x1-xs]
+            return out
+
+    img = tifffile.memmap(tif, mode='r')
+    if samples == 1:
+        img = img.reshape(1, height, width)
+    elif not separate:
+        img = img.transpose(2, 0, 1)
+    return img[:, row0:row0+h, col0:col0+w]
+
+
+def read_GF3_meta(path:str)->dict:
+    ''' Read qualify value and calibration constant (K_dB) from the
+    .meta.xml file of Gaofen-3 product
+
+    Args:
+        path (str): folder to the product file
 
-    s2 = np.stack((s11, s12, s21, s22), axis=0)
-    return s2
+    Returns:
+        dict with 'QualifyValue' and 'CalibrationConst' keys, each is a
+        float32 array of the polarizations
+    '''
+    meta_xml_path = glob(osp.join(path, '*.meta.xml'))
+    root = et.parse(osp.join(meta_xml_path[0])).getroot()
 
+    meta = dict()
+    for key in ('QualifyValue', 'CalibrationConst'):
+        values = []
+        for item in root.iter(key):
+            for pol in item:
+                values.append(pol.text)
+        meta[key] = np.array(values).astype(np.float32)
+    return meta
 
-def read_c3_GF3_L2(path, is_print=False):
+
+def calibrate_GF3_L2(img:ndarray, qualify_value, calibrate_const, out=None, linear=False, chunk_rows=256)->ndarray:
+    ''' Calibrate the DN values of Gaofen-3 L2 data into sigma0, in place and
+    row chunk by row chunk, no full-size temporary is allocated
+
+    sigma0_dB = 10*log10(DN^2 * (qualify_value/65535)^2) - K_dB
+              = 20*log10(DN) + 20*log10(qualify_value/65535) - K_dB
+
+    Args:
+        img (ndarray): DN values in [channel, height, width] shape
+        qualify_value (array like): qualify value of each channel
+        calibrate_const (array like): calibration constant (K_dB) of each
+            channel
+        out (ndarray): float32 output array in the same shape of img, can be
+            img itself if it is float32. None means allocating a new one.
+            Default: None
+        linear (bool): if True, output linear sigma0 instead of the 
+            logarithmized one. Default: False
+        chunk_rows (int): number of rows processed at once. Default: 256
+
+    Returns:
+        out (ndarray): calibrated data in float32
+    '''
+    if out is None:
+        out = np.empty(img.shape, dtype=np.float32)
+    qualify_value = np.asarray(qualify_value, dtype=np.float64).reshape(-1)
+    calibrate_const = np.asarray(calibrate_const, dtype=np.float64).reshape(-1)
+
+    for ii in range(img.shape[0]):
+        if linear:
+            scale = np.float32((qualify_value[ii]/65535)**2 * 10**(-calibrate_const[ii]/10))
+        else:
+            bias = np.float32(20*np.log10(qualify_value[ii]/65535) - calibrate_const[ii])
+        for row in range(0, img.shape[1], chunk_rows):
+            chunk = out[ii, row:row+chunk_rows]
+            np.maximum(img[ii, row:row+chunk_rows], mathlib.eps, out=chunk, dtype=np.float32)
+            if linear:
+                np.square(chunk, out=chunk)
+                np.multiply(chunk, scale, out=chunk)
+            else:
+                np.log10(chunk, out=chunk)
+                np.multiply(chunk, np.float32(20), out=chunk)
+                np.add(chunk, bias, out=chunk)
+    return out
+
+
+def read_c3_GF3_L2(path, is_print=False, window=None, linear=False):
     ''' Read 4 channel (HH, HV, VH, VV) data from Gaofen-3 L2 data
 
     Args:
         path (str): folder to the product file
         is_print (bool): if to print infos
+        window (tuple or None): in the form of (row0, col0, h, w), only this
+            part is read and calibrated, None means the whole image. 
+            Default: None
+        linear (bool): if to output linear sigma0 instead of the 
+            logarithmized one. Default: False
 
     Returns:
         img (ndarray): four channels data in [channel, height, weight] shape, logarithmized
@@ -237,42 +749,32 @@ def read_c3_GF3_L2(path, is_print=False):
     tifs.sort()
 
     # read qualify value and calibration constant (K_dB)
-    meta_xml_path = glob(osp.join(path, '*.meta.xml'))
-    root = et.parse(osp.join(meta_xml_path[0])).getroot()
-
-    calibrate_const = []
-    for item in root.iter('CalibrationConst'):
-        for pol in item:
-            calibrate_const.append(pol.text)
-    calibrate_const = np.array(calibrate_const).reshape(-1, 1, 1).astype(np.float32)
-    
-    qualify_value = []
-    for item in root.iter('QualifyValue'):
-        for pol in item:
-            qualify_value.append(pol.text)
-    qualify_value = np.array(qualify_value).reshape(-1, 1, 1).astype(np.float32)
+    meta = read_GF3_meta(path)
 
     # read tiff
-    img = [tifffile.imread(tif) for tif in tifs]
-    img = np.stack(img, axis=0)
+    img = None
+    for ii, tif in enumerate(tifs):
+        band = read_tiff_window(tif, window)[0]
+        if img is None:
+            img = np.empty((len(tifs), *band.shape), dtype=np.float32)
+        img[ii] = band
     if is_print:
         print(f'image shape: {img.shape}\n')    
 
-    # calibrate
-    img = img.astype(np.float32) 
-    img[img<mathlib.eps] = mathlib.eps
-    img = 10*np.log10(img**2 * (qualify_value/65535)**2) - calibrate_const
-
-    return img
+    # calibrate in place
+    return calibrate_GF3_L2(img, meta['QualifyValue'], meta['CalibrationConst'], out=img, linear=linear)
     
 
-def read_s2_GF3_L1A(path, file_ext='tiff', is_print=False):
+def read_s2_GF3_L1A(path, file_ext='tiff', is_print=False, window=None):
     ''' Read 4 channel (HH, HV, VH, VV) data from Gaofen-3 L1A data, discarding calibration const!!!
 
     Args:
         path (str): folder to the product file
         file_ext (Str): file extern. Default: tiff
         is_print (bool): if to print infos
+        window (tuple or None): in the form of (row0, col0, h, w), only this
+            part is read and scaled, None means the whole image. 
+            Default: None
 
     Returns:
         img (ndarray): four channels data in [channel, height, weight] shape
@@ -285,92 +787,567 @@ def read_s2_GF3_L1A(path, file_ext='tiff', is_print=False):
     tifs = glob(osp.join(path, '*.'+file_ext))
     tifs.sort()
 
-    # read qualify value and calibration constant (K_dB)
-    meta_xml_path = glob(osp.join(path, '*.meta.xml'))
-    root = et.parse(osp.join(meta_xml_path[0])).getroot()
-    
-    qualify_value = []
-    for item in root.iter('QualifyValue'):
-        for pol in item:
-            qualify_value.append(pol.text)
-    qualify_value = np.array(qualify_value).reshape(-1, 1, 1).astype(np.float32)
-    qualify_value = np.repeat(qualify_value, 2)
-    qualify_value = qualify_value[:, np.newaxis, np.newaxis]
-
-    # read tiff
-    img = [tifffile.imread(tif) for tif in tifs]
-    img = np.concatenate(img, axis=0)
+    # read qualify value
+    qualify_value = read_GF3_meta(path)['QualifyValue']
+
+    # read tiff, and scale the real and imaginary parts into the complex64
+    # output in place
+    cimg = None
+    for ii, tif in enumerate(tifs):
+        img = read_tiff_window(tif, window)
+        if cimg is None:
+            cimg = np.empty(shape=(len(tifs), *img.shape[1:]), dtype=np.complex64)
+        scale = np.float32(qualify_value[ii] / 32767)
+        np.multiply(img[0], scale, out=cimg[ii].real, dtype=np.float32)
+        np.multiply(img[1], scale, out=cimg[ii].imag, dtype=np.float32)
     if is_print:
-        print(f'image shape: {img.shape}\n')    
-
-    # calibrate
-    img = img.astype(np.float32) 
-    # img[img<mathlib.eps] = mathlib.eps
-    img = img * qualify_value / 32767
+        print(f'image shape: {cimg.shape}\n')    
 
-    cimg = np.empty(shape=(4, *img.shape[1:]), dtype=np.complex64)
-    cimg.real = img[::2, ...]
-    cimg.imag = img[1::2, ...]
     return cimg
     
 
-def s22c3(path=None, s2=None):
+def s22c3(path=None, s2=None, out='complex_vector_9', looks=1, block_rows=256, num_workers=0, channel_axis=None):
     ''' Convert s2 data to C3 data
 
+    Only the six unique terms of the Hermitian matrix are computed, in 
+    single precision, row block by row block, so the memory is bounded by
+    the output and a block. If "path" is specified, the s2 data is 
+    memory-mapped instead of read into memory.
+
     Args:
         path (str): path of s2 data
         s2 (ndarray): s2 data, should not be used if "path" is specified
+        out (str): storage mode of the output, 'save_space' or 
+            'complex_vector_6' or 'complex_vector_9'. Default: 
+            'complex_vector_9'
+        looks (int | tuple): number of looks in (row, column) direction, 
+            the C3 matrix is averaged in the same pass. Default: 1
+        block_rows (int): number of rows of a block. Default: 256
+        num_workers (int): number of threads. Default: 0
+        channel_axis (int): channel axis of the data, None means [..., 
+            channel, height, width]. Default: None
 
     Returns:
-        converted C3 data in 'complex_vector_9' data format
+        converted C3 data in the specified storage mode
     '''
     
     if path is not None:
-        s2 = read_s2(path)
+        s2 = memmap_s2(path)
     
-    # lexicographic basis in reciprocal condition
-    _, h, w = s2.shape
-    kl = s2.copy()
-    kl[1, ...] = (kl[1, ...]+kl[2, ...]) / np.sqrt(2)
-    kl = kl[[0, 1, 3], ...]
-
-    # s2 convert to C3
-    C3 = np.einsum('ij..., jk...->ik...', kl[:, np.newaxis, ...], kl[np.newaxis, ...].conj())
-
-    return C3.reshape(9, h ,w)
+    return convert(s2, 'S2', 'C3', out=out, looks=looks, block_rows=block_rows, num_workers=num_workers, channel_axis=channel_axis)
 
     
-def c32t3(path: str=None, c3: ndarray=None) -> ndarray :
+def c32t3(path: str=None, c3: ndarray=None, channel_axis=None) -> ndarray :
     ''' change C3 data to T3 data 
     @in     -path       -path of c3 data
             -C3         -C3 data, should not be used if "path" is specified
-    @ret    -T3         -T3 data
+            -channel_axis -channel axis of the data, None means [..., channel, height, width]
+    @ret    -T3         -T3 data in 'save_space' format
+    '''
+    if path:
+        c3 = read_c3(path, out='save_space')
+    return convert(c3, 'C3', 'T3', out='save_space', channel_axis=channel_axis)
+
+
+def t32c3(path: str=None, t3: ndarray=None, channel_axis=None) -> ndarray :
+    ''' change T3 data to C3 data 
+    @in     -path       -path of t3 data
+            -t3         -T3 data, should not be used if "path" is specified
+            -channel_axis -channel axis of the data, None means [..., channel, height, width]
+    @ret    -C3         -C3 data in 'save_space' format
+    '''
+    if path:
+        t3 = read_t3(path, out='save_space')
+    return convert(t3, 'T3', 'C3', out='save_space', channel_axis=channel_axis)
+
+
+def s22t3(path: str=None, s2: ndarray=None, channel_axis=None) -> ndarray :
+    ''' change s2 data to T3 data 
+    @in     -path       -path of s2 data
+            -s2         -s2 data, should not be used if "path" is specified
+            -channel_axis -channel axis of the data, None means [..., channel, height, width]
+    @ret    -T3         -T3 data in 'save_space' format
     '''
     if path:
-        c3_ = read_c3(path, out='save_space')
+        s2 = read_s2(path)
+    return convert(s2, 'S2', 'T3', out='save_space', channel_axis=channel_axis)
+
+
+def outer_components(k0, k1, k2)->list:
+    ''' Real components of the 3x3 matrix k*k^H, in 'save_space' order, only
+    the upper triangle is computed '''
+    m01 = k0 * k1.conj()
+    m02 = k0 * k2.conj()
+    m12 = k1 * k2.conj()
+    return [k0.real**2 + k0.imag**2, m01.real, m01.imag, m02.real, m02.imag, 
+            k1.real**2 + k1.imag**2, m12.real, m12.imag, 
+            k2.real**2 + k2.imag**2]
+
+
+def c3_to_t3_components(c:list)->list:
+    ''' Real components of T3 from the real components of C3 '''
+    sqrt2 = 2 ** 0.5
+    return [(c[0] + 2*c[3] + c[8]) / 2, (c[0] - c[8]) / 2, -c[4], 
+            (c[1] + c[6]) / sqrt2, (c[2] - c[7]) / sqrt2, 
+            (c[0] - 2*c[3] + c[8]) / 2, (c[1] - c[6]) / sqrt2, 
+            (c[2] + c[7]) / sqrt2, c[5]]
+
+
+def t3_to_c3_components(t:list)->list:
+    ''' Real components of C3 from the real components of T3 '''
+    sqrt2 = 2 ** 0.5
+    return [(t[0] + 2*t[1] + t[5]) / 2, (t[3] + t[6]) / sqrt2, 
+            (t[4] + t[7]) / sqrt2, (t[0] - t[5]) / 2, -t[2], t[8], 
+            (t[3] - t[6]) / sqrt2, (t[7] - t[4]) / sqrt2, 
+            (t[0] - 2*t[1] + t[5]) / 2]
+
+
+def s2_to_c3_components(s2)->list:
+    ''' Real components of C3 from s2 data, in the reciprocal condition '''
+    sqrt2 = 2 ** 0.5
+    return outer_components(s2[0], (s2[1]+s2[2]) / sqrt2, s2[3])
+
+
+def s2_to_t3_components(s2)->list:
+    ''' Real components of T3 from s2 data, in the reciprocal condition '''
+    sqrt2 = 2 ** 0.5
+    return outer_components((s2[0]+s2[3]) / sqrt2, (s2[0]-s2[3]) / sqrt2, 
+                            (s2[1]+s2[2]) / sqrt2)
+
+
+# conversion kernels, map the input block to the real components of the 
+# output matrix in 'save_space' order, C3/T3 input blocks are given as the 
+# list of their real components
+convert_kernels = {
+    ('C3', 'C3'): lambda c: c,
+    ('T3', 'T3'): lambda t: t,
+    ('C3', 'T3'): c3_to_t3_components,
+    ('T3', 'C3'): t3_to_c3_components,
+    ('S2', 'C3'): s2_to_c3_components,
+    ('S2', 'T3'): s2_to_t3_components,
+    }
+
+
+def check_channel_axis(data:ndarray, channel_axis=None)->int:
+    ''' Normalize the channel axis, None means the third axis from the end, 
+    i.e. data in [..., channel, height, width] shape, where the leading 
+    axes are batch axes '''
+    if channel_axis is None:
+        channel_axis = data.ndim - 3
+    if not -data.ndim <= channel_axis < data.ndim or data.ndim < 3:
+        raise ValueError(f'wrong channel axis {channel_axis} of data in {data.shape} shape')
+    return channel_axis % data.ndim
+
+
+def channel_buffer(buffer:ndarray, shape:tuple, dtype, channel_axis:int):
+    ''' Allocate the output buffer if it is None, the channel axis of the 
+    buffer is at the same position as the input data
+
+    Args:
+        buffer (ndarray): preallocated output array or None
+        shape (tuple): channel-first shape of the output
+        dtype: data type of the output
+        channel_axis (int): normalized channel axis
+
+    Returns:
+        the buffer, and its channel-first view
+    '''
+    if buffer is None:
+        full_shape = list(shape[1:])
+        full_shape.insert(channel_axis, shape[0])
+        buffer = np.empty(full_shape, dtype=dtype)
+    return buffer, np.moveaxis(buffer, channel_axis, 0)
+
+
+def write_components(comps:list, out:str, buffer:ndarray):
+    ''' Write the real components in 'save_space' order into the buffer in 
+    the specified storage mode '''
+    for ii, (re_idx, im_idx, sign) in enumerate(format_tables[out]):
+        if out == 'save_space':
+            np.copyto(buffer[ii], comps[re_idx], casting='same_kind')
+            continue
+        np.copyto(buffer[ii].real, comps[re_idx], casting='same_kind')
+        if im_idx is None:
+            buffer[ii].imag = 0
+        elif sign > 0:
+            np.copyto(buffer[ii].imag, comps[im_idx], casting='same_kind')
+        else:
+            np.negative(comps[im_idx], out=buffer[ii].imag, casting='same_kind')
+
+
+def multilook_block(data:ndarray, looks:tuple)->ndarray:
+    ''' Average a [..., height, width] block over non-overlapping (row, 
+    column) windows, the remainder rows and columns are dropped '''
+    la, lr = looks
+    h, w = data.shape[-2] // la, data.shape[-1] // lr
+    block = data[..., :h*la, :w*lr].reshape(*data.shape[:-2], h, la, w, lr)
+    return block.mean(axis=(-3, -1), dtype=block.dtype)
+
+
+def run_row_blocks(func, h:int, block_rows:int, num_workers=0)->None:
+    ''' Call func(row0, row1) for each block of "block_rows" rows in [0, h)
+
+    Args:
+        func (callable): function processing the rows [row0, row1)
+        h (int): number of rows
+        block_rows (int): number of rows of a block
+        num_workers (int): number of threads to process the blocks at the
+            same time, 0 means sequentially. Default: 0
+    '''
+    blocks = [(row0, min(row0+block_rows, h)) for row0 in range(0, h, block_rows)]
+    if num_workers > 0:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            futures = [pool.submit(func, *block) for block in blocks]
+            for future in futures:
+                future.result()
     else:
-        c3_  = as_format(c3, 'save_space')
-    
-    t3 = np.zeros_like(c3_)
-    t3[0, ...] = (c3_[0, ...] + 2*c3_[3, ...] + c3_[8, ...]) / 2
-    t3[1, ...] = (c3_[0, ...] - c3_[8, ...]) / 2
-    t3[2, ...] = -c3_[4, ...]
-    t3[3, ...] = (c3_[1, ...] + c3_[6, ...]) / np.sqrt(2)
-    t3[4, ...] = (c3_[2, ...] - c3_[7, ...]) / np.sqrt(2)
-    t3[5, ...] = (c3_[0, ...] - 2*c3_[3, ...] + c3_[8, ...]) / 2
-    t3[6, ...] = (c3_[1, ...] - c3_[6, ...]) / np.sqrt(2)
-    t3[7, ...] = (c3_[2, ...] + c3_[7, ...]) / np.sqrt(2)
-    t3[8, ...] = c3_[5, ...]  
+        for block in blocks:
+            func(*block)
+
+
+def gather_components(data:ndarray, row0:int, row1:int, dtype)->list:
+    ''' Read the 9 real components of the rows [row0, row1) of C3 or T3 data
+
+    Args:
+        data (ndarray | list): C3 or T3 data in any storage mode, in 
+            [channel, ..., height, width] shape, or list of bands like the
+            output of memmap_c3()
+        row0 (int): first row
+        row1 (int): end row, exclusive
+        dtype (np.dtype): data type of the components
+
+    Returns:
+        list of the 9 real components in 'save_space' order
+    '''
+    block = [band[..., row0:row1, :] for band in data]
+    return [np.asarray(block[ch].imag if is_imag else block[ch].real, dtype=dtype) for ch, is_imag in format_sources[get_format(data)]]
+
+
+def convert(data:ndarray, src:str, dst:str, out:str='save_space', buffer:ndarray=None, looks=1, block_rows=256, num_workers=0, channel_axis=None)->ndarray:
+    ''' Convert between C3, T3 and S2 data in one pass per row block
+
+    Each row block of the input is converted and written into the output 
+    buffer directly, so the temporaries are limited to the size of a block,
+    and the input can be a memmap, e.g. from memmap_c3().
+
+    Args:
+        data (ndarray | list | Tensor): C3 or T3 data in any storage mode,
+            or s2 data in [4, height, width] shape, with optional leading 
+            batch axes, or list of bands like the output of memmap_c3(), 
+            torch tensors are processed by convert_torch()
+        src (str): format of the input data, 'C3', 'T3' or 'S2'
+        dst (str): format of the output data, 'C3' or 'T3'
+        out (str): storage mode of the output, 'save_space' or 
+            'complex_vector_6' or 'complex_vector_9'. Default: 'save_space'
+        buffer (ndarray): preallocated output array, None means allocating
+            a new one. Default: None
+        looks (int | tuple): number of looks in (row, column) direction, 
+            if larger than 1, the output is multilooked in the same pass.
+            Default: 1
+        block_rows (int): number of rows of a block, rounded up to a 
+            multiple of the row looks. Default: 256
+        num_workers (int): number of threads to convert the blocks at the
+            same time, 0 means sequentially. Default: 0
+        channel_axis (int): channel axis of the data and the buffer, None
+            means [..., channel, height, width]. Default: None
+
+    Returns:
+        converted data
+    '''
+
+    if isinstance(data, torch.Tensor):
+        return convert_torch(data, src, dst, out=out, buffer=buffer, looks=looks, channel_axis=channel_axis)
+
+    if (src, dst) not in convert_kernels:
+        raise NotImplementedError(f'conversion from {src} to {dst} is not supported')
+    if out not in format_tables:
+        raise LookupError('wrong out format')
+    kernel = convert_kernels[(src, dst)]
+    if isinstance(data, ndarray):
+        channel_axis = check_channel_axis(data, channel_axis)
+        data = np.moveaxis(data, channel_axis, 0)
+    else:
+        channel_axis = 0
+
+    if src == 'S2' and len(data) != 4:
+        raise LookupError('wrong shape of input data')
+
+    if isinstance(looks, int):
+        looks = (looks, looks)
+    *batch, h, w = data[0].shape
+    out_shape = (*batch, h // looks[0], w // looks[1])
+    block_rows = -(-block_rows // looks[0]) * looks[0]
+
+    real_dtype = mathlib.float_dtype(data[0].dtype)
+    dtype = mathlib.float_dtype(real_dtype, is_complex=(out!='save_space'))
+    buffer, buffer_cf = channel_buffer(buffer, (len(format_tables[out]), *out_shape), dtype, channel_axis)
 
-    return t3
+    def convert_block(row0, row1):
+        if src == 'S2':
+            block = [np.asarray(band[..., row0:row1, :], dtype=mathlib.float_dtype(real_dtype, is_complex=True)) for band in data]
+        else:
+            block = gather_components(data, row0, row1, real_dtype)
+        comps = kernel(block)
+        if looks != (1, 1):
+            comps = [multilook_block(comp, looks) for comp in comps]
+        write_components(comps, out, buffer_cf[..., row0//looks[0]:row1//looks[0], :])
+
+    run_row_blocks(convert_block, out_shape[-2] * looks[0], block_rows, num_workers)
+    return buffer
+
+
+def channel_buffer_torch(buffer:torch.Tensor, shape:tuple, out:str, like:torch.Tensor, channel_axis:int):
+    ''' Torch version of channel_buffer(), the data type of the output is 
+    decided by the storage mode and the real component "like" '''
+    if buffer is None:
+        real_dtype = like.dtype if like.is_floating_point() else torch.float32
+        dtype = real_dtype if out == 'save_space' else torch.promote_types(real_dtype, torch.complex64)
+        full_shape = list(shape[1:])
+        full_shape.insert(channel_axis, shape[0])
+        buffer = torch.empty(full_shape, dtype=dtype, device=like.device)
+    return buffer, buffer.movedim(channel_axis, 0)
+
+
+def write_components_torch(comps:list, out:str, buffer:torch.Tensor):
+    ''' Torch version of write_components(), only copy_() is used, so it 
+    can be differentiated by autograd '''
+    if out != 'save_space':
+        buffer = torch.view_as_real(buffer)
+    for ii, (re_idx, im_idx, sign) in enumerate(format_tables[out]):
+        if out == 'save_space':
+            buffer[ii].copy_(comps[re_idx])
+            continue
+        buffer[ii, ..., 0].copy_(comps[re_idx])
+        if im_idx is None:
+            buffer[ii, ..., 1].zero_()
+        elif sign > 0:
+            buffer[ii, ..., 1].copy_(comps[im_idx])
+        else:
+            buffer[ii, ..., 1].copy_(-comps[im_idx])
+
+
+def convert_torch(data:torch.Tensor, src:str, dst:str, out:str='save_space', buffer:torch.Tensor=None, looks=1, channel_axis=None)->torch.Tensor:
+    ''' Torch version of convert(), with the same semantics
+
+    The whole tensor is converted in one pass, the parallelism comes from
+    the intra-op threads of torch, see torch.set_num_threads().
+
+    Args:
+        data (Tensor): C3 or T3 data in any storage mode, or s2 data
+        src (str): format of the input data, 'C3', 'T3' or 'S2'
+        dst (str): format of the output data, 'C3' or 'T3'
+        out (str): storage mode of the output. Default: 'save_space'
+        buffer (Tensor): preallocated output tensor. Default: None
+        looks (int | tuple): number of looks in (row, column) direction.
+            Default: 1
+        channel_axis (int): channel axis of the data and the buffer, None
+            means [..., channel, height, width]. Default: None
+
+    Returns:
+        converted data
+    '''
+
+    if (src, dst) not in convert_kernels:
+        raise NotImplementedError(f'conversion from {src} to {dst} is not supported')
+    if out not in format_tables:
+        raise LookupError('wrong out format')
+    kernel = convert_kernels[(src, dst)]
+    channel_axis = check_channel_axis(data, channel_axis)
+    data = data.movedim(channel_axis, 0)
+
+    if src == 'S2':
+        if len(data) != 4:
+            raise LookupError('wrong shape of input data')
+        block = data
+    else:
+        block = [data[ch].imag if is_imag else data[ch].real for ch, is_imag in format_sources[get_format(data)]]
+    comps = kernel(block)
+
+    if isinstance(looks, int):
+        looks = (looks, looks)
+    if looks != (1, 1):
+        la, lr = looks
+        h, w = data.shape[-2] // la, data.shape[-1] // lr
+        comps = [comp[..., :h*la, :w*lr].reshape(*comp.shape[:-2], h, la, w, lr).mean(dim=(-3, -1)) for comp in comps]
+
+    buffer, buffer_cf = channel_buffer_torch(buffer, (len(format_tables[out]), *comps[0].shape), out, comps[0], channel_axis)
+    write_components_torch(comps, out, buffer_cf)
+    return buffer
+
+
+def encode_bands(data:ndarray, encoding='log_int16', dynamic_range=1e5):
+    ''' Encode the bands of C3 or T3 data in reduced precision
 
+    'float16': the data is stored in half precision.
+    'log_int16': each band is stored in int16 by a signed logarithmic 
+        quantization, i.e. q = round(asinh(x/scale) / asinh(max/scale) * 
+        32767), where max is the maximum absolute value of the band, and
+        scale = max / dynamic_range. The relative error of the values
+        greater than scale is about log(2*dynamic_range) / 65534
 
-def write_config_hdr(path:str, config:Union[dict, list, tuple], config_type='hdr', data_type='c3')->None:
+    Args:
+        data (ndarray): C3 or T3 data in any storage mode
+        encoding (str): 'float16' or 'log_int16'. Default: 'log_int16'
+        dynamic_range (float): dynamic range of 'log_int16' encoding. 
+            Default: 1e5
+
+    Returns:
+        encoded (ndarray): encoded data in 'save_space' storage mode
+        band_fields (list): header fields of each band, which is needed by
+            decode_bands()
+    '''
+    data = as_format(data, out='save_space')
+    if encoding == 'float16':
+        if np.abs(data).max() > np.finfo(np.float16).max:
+            raise ValueError('data exceeds the range of float16, use "log_int16" instead')
+        return data.astype(np.float16), [{'polsar encoding': 'float16'} for _ in range(data.shape[0])]
+    elif encoding != 'log_int16':
+        raise NotImplementedError(f'unrecognized encoding: {encoding}')
+
+    encoded = np.empty(data.shape, dtype=np.int16)
+    band_fields = []
+    tmp = np.empty(data.shape[1:], dtype=np.float32)
+    for ii in range(data.shape[0]):
+        vmax = float(np.abs(data[ii]).max())
+        scale = vmax / dynamic_range if vmax > 0 else 1.0
+        np.divide(data[ii], np.float32(scale), out=tmp, dtype=np.float32)
+        np.arcsinh(tmp, out=tmp)
+        np.multiply(tmp, np.float32(32767 / max(np.arcsinh(vmax/scale), 1)), out=tmp)
+        np.rint(tmp, out=tmp)
+        encoded[ii] = tmp
+        band_fields.append({'polsar encoding': 'log_int16',
+                            'polsar scale': repr(scale),
+                            'polsar max': repr(vmax)})
+    return encoded, band_fields
+
+
+def decode_bands(encoded:ndarray, band_fields:list, out=None)->ndarray:
+    ''' Decode the bands encoded by encode_bands() into float32
+
+    Args:
+        encoded (ndarray): encoded data in [channel, height, width] shape
+        band_fields (list): header fields of each band, e.g. the output of
+            read_hdr()
+        out (ndarray): float32 output array. Default: None
+
+    Returns:
+        out (ndarray): decoded float32 data
+    '''
+    if out is None:
+        out = np.empty(encoded.shape, dtype=np.float32)
+    for ii, fields in enumerate(band_fields):
+        encoding = fields.get('polsar encoding')
+        if encoding == 'float16':
+            out[ii] = encoded[ii]
+        elif encoding == 'log_int16':
+            scale = float(fields['polsar scale'])
+            vmax = float(fields['polsar max'])
+            np.multiply(encoded[ii], np.float32(max(np.arcsinh(vmax/scale), 1) / 32767), out=out[ii], dtype=np.float32)
+            np.sinh(out[ii], out=out[ii])
+            np.multiply(out[ii], np.float32(scale), out=out[ii])
+        else:
+            raise NotImplementedError(f'unrecognized encoding: {encoding}')
+    return out
+
+
+def encoding_error(data:ndarray, encoding='log_int16', dynamic_range=1e5)->dict:
+    ''' Report the round-trip error of the reduced-precision encoding
+
+    Args:
+        data (ndarray): C3 or T3 data in any storage mode
+        encoding (str): 'float16' or 'log_int16'. Default: 'log_int16'
+        dynamic_range (float): dynamic range of 'log_int16' encoding. 
+            Default: 1e5
+
+    Returns:
+        dict of the error of each band in 'save_space' order, including
+        'max_abs_err', 'max_rel_err' (of the nonzero values), 'rmse' and 
+        'snr' (in dB)
+    '''
+    data = as_format(data, out='save_space').astype(np.float32, copy=False)
+    decoded = decode_bands(*encode_bands(data, encoding, dynamic_range))
+    err = np.abs(decoded - data).reshape(data.shape[0], -1)
+    data = np.abs(data).reshape(data.shape[0], -1)
+
+    rel_err = np.divide(err, data, out=np.zeros_like(err), where=data>0)
+    rmse = np.sqrt((err.astype(np.float64)**2).mean(axis=1))
+    power = np.sqrt((data.astype(np.float64)**2).mean(axis=1))
+    return {'max_abs_err': err.max(axis=1),
+            'max_rel_err': rel_err.max(axis=1),
+            'rmse': rmse,
+            'snr': 20*np.log10(power / np.maximum(rmse, mathlib.eps)),
+            }
+
+
+def write_encoded_bins(path:str, data:ndarray, data_type:str, config, encoding='log_int16', dynamic_range=1e5):
+    ''' Write C3 or T3 data in reduced precision, the encoding and the 
+    scale factors of each band are stored in its .bin.hdr file
+
+    Args:
+        path (str): data path
+        data (ndarray): the polSAR data
+        data_type (str): 'c3' or 't3'
+        config (dict or list or tuple): config information, see 
+            write_config_hdr(), only 'hdr' config type is supported
+        encoding (str): 'float16' or 'log_int16'. Default: 'log_int16'
+        dynamic_range (float): dynamic range of 'log_int16' encoding. 
+            Default: 1e5
+    '''
+    encoded, band_fields = encode_bands(data, encoding, dynamic_range)
+    if isinstance(config, (list, tuple)):
+        config = {'lines': str(config[0]), 'samples': str(config[1]),
+                'interleave': 'bsq'}
+    # float16 is not an ENVI data type, it is stored as uint16
+    config = dict(config)
+    config['data type'] = '12' if encoding == 'float16' else '2'
+    config['byte order'] = get_envi_byte_order(encoded.dtype)
+    write_config_hdr(path, config, data_type=data_type, band_fields=band_fields)
+
+    bin_files = c3_bin_files if data_type == 'c3' else t3_bin_files
+    for idx, bin in enumerate(bin_files):
+        encoded[idx].tofile(osp.join(path, bin))
+
+
+def read_envi_bins(path:str, bin_files:list, meta_info:dict, window=None, offset=0, num_workers=0)->ndarray:
+    ''' Read a window of single band ENVI binary files, the bands encoded
+    by write_encoded_bins() are decoded into float32 transparently
+
+    Args:
+        path (str): folder of the binary files
+        bin_files (list): names of the binary files, one for each channel
+        meta_info (dict): meta info of the first .bin.hdr file
+        window (tuple or None): in the form of (row0, col0, h, w), None means
+            the whole image. Default: None
+        offset (int): offset in bytes besides the header offset. Default: 0
+        num_workers (int): number of threads to read the band files at the
+            same time. Default: 0
+
+    Returns:
+        data in [channel, h, w] shape
+    '''
+    samples = int(meta_info['samples'])
+    window = check_window(window, (int(meta_info['lines']), samples))
+    offset += int(meta_info.get('header offset', 0))
+    dtype = get_envi_dtype(meta_info)
+    encoding = meta_info.get('polsar encoding')
+    if encoding == 'float16':
+        dtype = np.dtype(np.float16).newbyteorder(dtype.byteorder)
+
+    data = np.empty((len(bin_files), window[2], window[3]), dtype=dtype)
+    read_bins_window(path, bin_files, data, window, samples, offset=offset, num_workers=num_workers)
+    if encoding is not None:
+        band_fields = [read_hdr(path, file=bin) for bin in bin_files]
+        data = decode_bands(data, band_fields)
+    return data
+
+
+def write_config_hdr(path:str, config:Union[dict, list, tuple], config_type='hdr', data_type='c3', band_fields=None)->None:
     """
     write config.txt file and Cxx.hdr file
     @in     -path           -data path
             -config         -config information require for .bin.hdr file, in a dict format
             -config_type    -config type, 'hdr' or 'cfg'
+            -band_fields    -extra fields of each .bin.hdr file, a list of dict in the order of the binary files
     """
     if config_type=='hdr':
         if isinstance(config, dict):
@@ -384,7 +1361,7 @@ def write_config_hdr(path:str, config:Union[dict, list, tuple], config_type='hdr
             samples = str(config[1])
             datatype = '4'
             interleave = 'bsq'
-            byteorder = '0'
+            byteorder = get_envi_byte_order(np.float32)
         
         if data_type=='c3':
             bin_files = c3_bin_files
@@ -392,10 +1369,12 @@ def write_config_hdr(path:str, config:Union[dict, list, tuple], config_type='hdr
             bin_files = t3_bin_files
         elif data_type=='s2':
             bin_files = s2_bin_files
+        elif data_type=='HAalpha':
+            bin_files = HAalpha_bin_files
         else:
             raise ValueError('unrecognized data type')
 
-        for bin in bin_files:
+        for idx, bin in enumerate(bin_files):
             file_hdr = osp.join(path, bin + '.hdr')
             with open(file_hdr, 'w') as hdr:
                 hdr.write('ENVI\ndescription = {File Imported into ENVI.}\n')
@@ -408,6 +1387,9 @@ def write_config_hdr(path:str, config:Union[dict, list, tuple], config_type='hdr
                 hdr.write('sensor type = Unknown\n')
                 hdr.write(f'byte order = {byteorder}\n')
                 hdr.write(f'band names = {{{bin}}}\n')
+                if band_fields is not None:
+                    for ky, val in band_fields[idx].items():
+                        hdr.write(f'{ky} = {val}\n')
     elif config_type=='cfg':
         lines = config['Nrow']
         samples = config['Ncol']
@@ -424,13 +1406,28 @@ def write_config_hdr(path:str, config:Union[dict, list, tuple], config_type='hdr
     
 
 
-def write_c3(path:str, data:ndarray, config:dict=None, config_type='hdr', is_print=False):    
+def float32_config(config:Union[dict, list, tuple]):
+    ''' Config of the native float32 bands written by write_c3() and 
+    write_t3(), the data type, byte order and the encoding fields of the 
+    source header, e.g. of a decoded or big-endian scene, are replaced by 
+    the ones of the written bands, the header offset is always 0 '''
+    if not isinstance(config, dict):
+        return config
+    config = {ky: val for ky, val in config.items() if not ky.startswith('polsar ')}
+    config['data type'] = '4'
+    config['byte order'] = get_envi_byte_order(np.float32)
+    return config
+
+
+def write_c3(path:str, data:ndarray, config:dict=None, config_type='hdr', is_print=False, encoding=None, dynamic_range=1e5):    
     ''' 
     write c3 data 
     @in     -path       -data path
             -data       -the polSAR data
             -config     -config information require for .bin.hdr file, in a dict format
             -is_print   -whether to print the debug info
+            -encoding   -None for float32, or reduced-precision 'float16' or 'log_int16', see encode_bands()
+            -dynamic_range -dynamic range of 'log_int16' encoding
     '''
     
     # check input
@@ -441,26 +1438,30 @@ def write_c3(path:str, data:ndarray, config:dict=None, config_type='hdr', is_pri
     # write config.txt and *.bin.hdr file
     if config is None:
         config = data.shape[1:]
+    if encoding is not None:
+        write_encoded_bins(path, data, 'c3', config, encoding, dynamic_range)
+        return
+    if config_type == 'hdr':
+        config = float32_config(config)
     write_config_hdr(path, config, config_type)
 
     # write binary files
-    if (isinstance(config, dict) and config['data type'] == '4') or isinstance(config, (list, tuple)):
-        data = as_format(data, out='save_space')
-        for idx, bin in enumerate(c3_bin_files):
-            fullpath = osp.join(path, bin)
-            file = data[idx, :, :]
-            file.tofile(fullpath)
-    else:
-        raise NotImplementedError('data type is not float32')
+    data = as_format(data, out='save_space').astype(np.float32, copy=False)
+    for idx, bin in enumerate(c3_bin_files):
+        fullpath = osp.join(path, bin)
+        file = data[idx, :, :]
+        file.tofile(fullpath)
 
 
-def write_t3(path:str, data:ndarray, config:dict=None, is_print=False):    
+def write_t3(path:str, data:ndarray, config:dict=None, is_print=False, encoding=None, dynamic_range=1e5):    
     ''' 
     write t3 data 
     @in     -path       -data path
             -data       -the polSAR data
             -config     -config information require for .bin.hdr file, in a dict format
             -is_print   -whether to print the debug info
+            -encoding   -None for float32, or reduced-precision 'float16' or 'log_int16', see encode_bands()
+            -dynamic_range -dynamic range of 'log_int16' encoding
     '''
     
     # check input
@@ -470,18 +1471,18 @@ def write_t3(path:str, data:ndarray, config:dict=None, is_print=False):
     # write config.txt and *.bin.hdr file
     if config is None:
         config = data.shape[1:]
-    write_config_hdr(path, config, data_type='t3')
+    if encoding is not None:
+        write_encoded_bins(path, data, 't3', config, encoding, dynamic_range)
+        return
+    write_config_hdr(path, float32_config(config), data_type='t3')
 
 
     # write binary files
-    if (isinstance(config, dict) and config['data type'] == '4') or isinstance(config, (list, tuple)):
-        data = as_format(data, out='save_space')
-        for idx, bin in enumerate(t3_bin_files):
-            fullpath = osp.join(path, bin)
-            file = data[idx, :, :]
-            file.tofile(fullpath)
-    else:
-        raise NotImplementedError('data type is not float32')
+    data = as_format(data, out='save_space').astype(np.float32, copy=False)
+    for idx, bin in enumerate(t3_bin_files):
+        fullpath = osp.join(path, bin)
+        file = data[idx, :, :]
+        file.tofile(fullpath)
 
 
 def write_s2(path:str, data:ndarray, config:dict=None, is_print=False, config_type='hdr'):    
@@ -511,6 +1512,274 @@ def write_s2(path:str, data:ndarray, config:dict=None, is_print=False, config_ty
         raise NotImplementedError('data type should be np.complex64')
 
 
+def write_chunked(path:str, data, tile=(512, 512), compression='zlib', level=6, data_format=None, is_print=False):
+    ''' Write PolSAR data into a single chunked file, the data is split into
+    fixed-size tiles, each tile is compressed independently, and the offsets
+    of all tiles are stored in the header, so that any tile can be fetched
+    with one seek
+
+    File layout: magic (8 bytes), length of the json meta info (uint32),
+    json meta info, tile index (uint64 array in [num_tiles, 2] shape, each
+    row is (offset, nbytes)), tile data
+
+    Args:
+        path (str): path of the chunked file
+        data (ndarray or list): data in [channel, height, width] shape, or a
+            list of [height, width] bands, e.g. the output of memmap_c3(), so
+            that the whole scene is never loaded at once
+        tile (tuple): shape of the tile, in [height, width] format. Default:
+            (512, 512)
+        compression (str): None, 'zlib' or 'lzma'. Default: 'zlib'
+        level (int): compression level. Default: 6
+        data_format (str): data format stored in the meta info, e.g. 'C3'.
+            Default: None
+        is_print (bool): whether to print the debug info. Default: False
+    '''
+    if is_print:
+        print('writing ', path)
+    if compression not in chunk_compressors:
+        raise NotImplementedError(f'unrecognized compression: {compression}')
+    compress = chunk_compressors[compression][0]
+
+    height, width = data[0].shape
+    p_het, p_wes = tile
+    grid = (math.ceil(height/p_het), math.ceil(width/p_wes))
+    meta = {'shape': [len(data), height, width],
+            'dtype': np.dtype(data[0].dtype).str,
+            'tile': [p_het, p_wes],
+            'grid': list(grid),
+            'compression': compression,
+            'data_format': data_format,
+            }
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    index = np.zeros((grid[0]*grid[1], 2), dtype='<u8')
+
+    with open(path, 'wb') as f:
+        f.write(chunk_magic)
+        f.write(struct.pack('<I', len(meta_bytes)))
+        f.write(meta_bytes)
+        index_pos = f.tell()
+        f.write(index.tobytes())
+
+        for idx in range(len(index)):
+            ys, xs = divmod(idx, grid[1])
+            ys *= p_het
+            xs *= p_wes
+            tile_data = np.empty((len(data), min(p_het, height-ys), min(p_wes, width-xs)), dtype=meta['dtype'])
+            for ii in range(len(data)):
+                tile_data[ii] = data[ii][ys:ys+p_het, xs:xs+p_wes]
+            buf = compress(tile_data.tobytes(), level)
+            index[idx] = (f.tell(), len(buf))
+            f.write(buf)
+
+        # fill the tile index
+        f.seek(index_pos)
+        f.write(index.tobytes())
+
+
+def read_chunked_header(f)->dict:
+    ''' Read the header of a chunked file
+
+    Args:
+        f (file object): opened chunked file, in binary mode
+
+    Returns:
+        meta (dict): meta info, the tile index is stored in meta['index']
+    '''
+    f.seek(0)
+    if f.read(len(chunk_magic)) != chunk_magic:
+        raise IOError('not a chunked PolSAR file')
+    meta_len, = struct.unpack('<I', f.read(4))
+    meta = json.loads(f.read(meta_len).decode('utf-8'))
+    num_tiles = meta['grid'][0] * meta['grid'][1]
+    meta['index'] = np.frombuffer(f.read(num_tiles*16), dtype='<u8').reshape(num_tiles, 2)
+    return meta
+
+
+def read_chunked_tile(f, meta:dict, idx:int)->ndarray:
+    ''' Read a tile of a chunked file with one seek
+
+    Args:
+        f (file object): opened chunked file, in binary mode
+        meta (dict): meta info returned by read_chunked_header()
+        idx (int): index of the tile, tiles are ordered row by row
+
+    Returns:
+        read-only tile data in [channel, height, width] shape, tiles at the
+        bottom or right boundary may be smaller than the tile size
+    '''
+    n_cols = meta['grid'][1]
+    channel, height, width = meta['shape']
+    p_het, p_wes = meta['tile']
+    ys, xs = divmod(idx, n_cols)
+    ys *= p_het
+    xs *= p_wes
+
+    offset, nbytes = meta['index'][idx]
+    f.seek(int(offset))
+    buf = chunk_compressors[meta['compression']][1](f.read(int(nbytes)))
+    return np.frombuffer(buf, dtype=meta['dtype']).reshape(channel, min(p_het, height-ys), min(p_wes, width-xs))
+
+
+def read_chunked(path:str, window=None, is_print=False)->ndarray:
+    ''' Read a chunked file, only the tiles covered by the window are read
+
+    Args:
+        path (str): path of the chunked file
+        window (tuple or None): in the form of (row0, col0, h, w), None means
+            the whole image. Default: None
+        is_print (bool): whether to print the debug info. Default: False
+
+    Returns:
+        data in [channel, height, width] shape
+    '''
+    if is_print:
+        print('reading from ', path)
+
+    with open(path, 'rb') as f:
+        meta = read_chunked_header(f)
+        channel, height, width = meta['shape']
+        p_het, p_wes = meta['tile']
+        row0, col0, h, w = check_window(window, (height, width))
+
+        out = np.empty((channel, h, w), dtype=meta['dtype'])
+        for ty in range(row0//p_het, (row0+h-1)//p_het + 1):
+            for tx in range(col0//p_wes, (col0+w-1)//p_wes + 1):
+                tile_data = read_chunked_tile(f, meta, ty*meta['grid'][1]+tx)
+                ys, xs = ty*p_het, tx*p_wes
+
+                # overlapped part of the tile and the window
+                y0, y1 = max(ys, row0), min(ys+tile_data.shape[1], row0+h)
+                x0, x1 = max(xs, col0), min(xs+tile_data.shape[2], col0+w)
+                out[:, y0-row0:y1-row0, x0-col0:x1-col0] = tile_data[:, y0-ys:y1-ys, x0-xs:x1-xs]
+    return out
+
+
+class PatchWriter():
+    ''' Write PolSAR patches (binary files, headers and preview images) in
+    background threads. Each patch is written into a temporary folder
+    first, and renamed to the destination when finished, so an interrupted
+    job never leaves half-written patches behind
+
+    Example:
+        with PatchWriter(num_workers=4) as writer:
+            for folder, patch, pauli in patches:
+                writer.write(folder, patch, 'c3', images={'PauliRGB.bmp': pauli})
+
+    Args:
+        num_workers (int): number of writing threads, 0 means writing in the
+            caller's thread. Default: 4
+        max_queue (int): maximum number of pending patches, write() blocks
+            when the queue is full. Default: 16
+        is_print (bool): whether to print the debug info. Default: False
+    '''
+
+    def __init__(self, num_workers=4, max_queue=16, is_print=False) -> None:
+        self.num_workers = num_workers
+        self.is_print = is_print
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.errors = []
+        self.closed = False
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(num_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def write(self, path:str, data:ndarray, data_type='c3', config=None, images=None):
+        ''' Put a patch into the writing queue, the data should not be
+        modified until flush() or close() returns
+
+        Args:
+            path (str): destination folder of the patch
+            data (ndarray): the polSAR data
+            data_type (str): 'c3', 't3' or 's2'. Default: 'c3'
+            config (dict or list or tuple): config information, see 
+                write_config_hdr(). Default: None
+            images (dict): preview images to be written by cv2.imwrite(),
+                in the form of {file name: image}. Default: None
+        '''
+        if self.closed:
+            raise RuntimeError('write to a closed PatchWriter')
+        task = (path, data, data_type, config, images)
+        if self.num_workers > 0:
+            self.queue.put(task)
+        else:
+            self._write(*task)
+
+    def flush(self):
+        ''' Wait until all the queued patches are written, and raise the
+        first error occurred in the writing threads
+        '''
+        self.queue.join()
+        if self.errors:
+            error = self.errors[0]
+            self.errors = []
+            raise error
+
+    def close(self):
+        ''' Flush the queue and stop the writing threads '''
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush()
+        finally:
+            for _ in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _worker(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                self._write(*task)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, path, data, data_type, config, images):
+        if self.is_print:
+            print('writing ', path)
+
+        path = osp.normpath(path)
+        parent, name = osp.split(path)
+        tmp_path = osp.join(parent, f'.{name}.tmp-{uuid.uuid4().hex}')
+        fu.mkdir_if_not_exist(tmp_path)
+        try:
+            if data_type == 'c3':
+                write_c3(tmp_path, data, config)
+            elif data_type == 't3':
+                write_t3(tmp_path, data, config)
+            elif data_type == 's2':
+                config_type = 'cfg' if isinstance(config, dict) and 'Nrow' in config else 'hdr'
+                write_s2(tmp_path, data, config, config_type=config_type)
+            else:
+                raise ValueError('unrecognized data type')
+            for file, img in (images or {}).items():
+                cv2.imwrite(osp.join(tmp_path, file), img)
+
+            # replace the destination
+            if osp.exists(path):
+                old_path = tmp_path + '.old'
+                os.rename(path, old_path)
+                os.rename(tmp_path, path)
+                shutil.rmtree(old_path)
+            else:
+                os.rename(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+
 def read_bmp(path:str, is_print=None)->np.ndarray:
     '''@brief   -read bmp image file
     @in      -path          -path to C3 data
@@ -525,124 +1794,158 @@ def read_bmp(path:str, is_print=None)->np.ndarray:
     return cv2.imread(osp.join(path, 'PauliRGB.bmp'))
 
 
-def as_format(data:np.ndarray, out:str='save_space')->np.ndarray:
-    '''@brief   -change the data organization format
-   @in      -data   -the data need to be transformed
-   @in      -out    -output data format, either 'save_space' or 'complex_vector_6' or 'complex_vector_9', 
-                    can't be the same with the input data format
-   @out     -transformed data
+# real components of the C3/T3 matrix in 'save_space' order, i.e. c11, 
+# c12_real, c12_imag, c13_real, c13_imag, c22, c23_real, c23_imag, c33. For 
+# each storage mode, the channels are described by (real component, 
+# imaginary component, sign of the imaginary component), None for zero 
+# imaginary part, 'save_space' mode is real-valued
+format_tables = {
+    'save_space': [(ii, None, 1) for ii in range(9)],
+    'complex_vector_6': [(0, None, 1), (1, 2, 1), (3, 4, 1), (5, None, 1), 
+                        (6, 7, 1), (8, None, 1)],
+    'complex_vector_9': [(0, None, 1), (1, 2, 1), (3, 4, 1), (1, 2, -1), 
+                        (5, None, 1), (6, 7, 1), (3, 4, -1), (6, 7, -1),
+                        (8, None, 1)],
+    }
+
+# where to find the real components in each storage mode, in the form of
+# (channel, if imaginary part)
+format_sources = {
+    'save_space': [(ii, False) for ii in range(9)],
+    'complex_vector_6': [(0, False), (1, False), (1, True), (2, False), 
+                        (2, True), (3, False), (4, False), (4, True), 
+                        (5, False)],
+    'complex_vector_9': [(0, False), (1, False), (1, True), (2, False), 
+                        (2, True), (4, False), (5, False), (5, True), 
+                        (8, False)],
+    }
+
+
+def get_format(data:np.ndarray)->str:
+    ''' Decide the storage mode of C3 or T3 data
+
+    Args:
+        data (ndarray | list | Tensor): data in [channel, height, width] 
+            shape, or list of bands
+
+    Returns:
+        'save_space', 'complex_vector_6' or 'complex_vector_9'
     '''
-    # decide the input data format
-    ch = data.shape[0]
-    # complex vector
-    if np.iscomplexobj(data):
-        # complex_vector_6
-        if ch==6:   
-            if out == 'save_space':
-                c11 = data[0, :, :].real
-                c12_real = data[1, :, :].real
-                c12_img = data[1, :, :].imag
-                c13_real = data[2, :, :].real
-                c13_img = data[2, :, :].imag
-                c22 = data[3, :, :].real
-                c23_real = data[4, :, :].real
-                c23_img = data[4, :, :].imag
-                c33 = data[5, :, :].real
-                c3 = np.stack((c11, c12_real, c12_img, c13_real, c13_img, c22, c23_real, c23_img, c33), axis=0)
-            elif out == 'complex_vector_9':
-                c11 = data[0, :, :]
-                c12 = data[1, :, :]
-                c13 = data[2, :, :]
-                c22 = data[3, :, :]
-                c23 = data[4, :, :]
-                c33 = data[5, :, :]
-                c3 = np.stack((c11, c12, c13, c12.conj(), c22, c23, c13.conj(), c23.conj(), c33), axis=0)
-            elif out == 'complex_vector_6':
-                c3 = data
-            else:
-                raise LookupError('wrong out format')
-
-        # complex_vector_9
-        elif ch==9: 
-            if out == 'save_space':
-                c11 = data[0, :, :].real
-                c12_real = data[1, :, :].real
-                c12_img = data[1, :, :].imag
-                c13_real = data[2, :, :].real
-                c13_img = data[2, :, :].imag
-                c22 = data[4, :, :].real
-                c23_real = data[5, :, :].real
-                c23_img = data[5, :, :].imag
-                c33 = data[8, :, :].real
-                c3 = np.stack((c11, c12_real, c12_img, c13_real, c13_img, c22, c23_real, c23_img, c33), axis=0)
-            elif out == 'complex_vector_6':
-                c11 = data[0, :, :]
-                c12 = data[1, :, :]
-                c13 = data[2, :, :]
-                c22 = data[4, :, :]
-                c23 = data[5, :, :]
-                c33 = data[8, :, :]
-                c3 = np.stack((c11, c12, c13, c22, c23, c33), axis=0)
-            elif out == 'complex_vector_9':
-                c3 = data
-            else:
-                raise LookupError('wrong out format')
+    ch = len(data)
+    # np.iscomplexobj() converts tensors to numpy, which fails on cuda 
+    # tensors and tensors requiring grad
+    if isinstance(data[0], torch.Tensor):
+        is_complex = data[0].is_complex()
+    else:
+        is_complex = np.iscomplexobj(data[0])
+    if is_complex:
+        if ch==6:
+            return 'complex_vector_6'
+        elif ch==9:
+            return 'complex_vector_9'
         else:
             raise LookupError('wrong shape of input data')
-        
-    # save_space
-    elif ch==9 :
-        if out == 'complex_vector_9':
-            c11 = data[0, :, :]
-            c12 = data[1, :, :] + 1j*data[2, :, :]
-            c13 = data[3, :, :] + 1j*data[4, :, :]
-            c22 = data[5, :, :]
-            c23 = data[6, :, :] + 1j*data[7, :, :]
-            c33 = data[8, :, :]
-            c3 = np.stack((c11, c12, c13, c12.conj(), c22, c23, c13.conj(), c23.conj(), c33), axis=0)
-        elif out == 'complex_vector_6':
-            c11 = data[0, :, :]
-            c12 = data[1, :, :] + 1j*data[2, :, :]
-            c13 = data[3, :, :] + 1j*data[4, :, :]
-            c22 = data[5, :, :]
-            c23 = data[6, :, :] + 1j*data[7, :, :]
-            c33 = data[8, :, :]
-            c3 = np.stack((c11, c12, c13,  c22, c23,  c33), axis=0)
-        elif out == 'save_space':
-            c3 = data
-        else:
-            raise LookupError('wrong out format')
+    elif ch==9:
+        return 'save_space'
     else:
         raise LookupError('wrong format of input data')
-    return c3
 
 
-def rgb_by_c3(data:np.ndarray, type:str='pauli', is_print=False, if_mask=False)->np.ndarray:
+def as_format(data:np.ndarray, out:str='save_space', buffer:np.ndarray=None, channel_axis=None)->np.ndarray:
+    '''@brief   -change the data organization format, driven by format_tables, each output channel is written
+                into the output array directly, float32 input and complex64 input are kept in single precision
+   @in      -data   -the data need to be transformed, torch tensors are processed by as_format_torch()
+   @in      -out    -output data format, either 'save_space' or 'complex_vector_6' or 'complex_vector_9', 
+                    if it is the same with the input data format, the input data is returned without copy
+   @in      -buffer -preallocated output array, None means allocating a new one
+   @in      -channel_axis -channel axis of the data and the buffer, None means [..., channel, height, width],
+                    i.e. the leading axes are batch axes
+   @out     -transformed data
+    '''
+    if isinstance(data, torch.Tensor):
+        return as_format_torch(data, out, buffer=buffer, channel_axis=channel_axis)
+
+    # decide the input data format
+    channel_axis = check_channel_axis(data, channel_axis)
+    data_cf = np.moveaxis(data, channel_axis, 0)
+    in_format = get_format(data_cf)
+    if out not in format_tables:
+        raise LookupError('wrong out format')
+    if in_format == out:
+        if buffer is None:
+            return data
+        np.copyto(buffer, data)
+        return buffer
+
+    dtype = mathlib.float_dtype(data.dtype, is_complex=(out!='save_space'))
+    buffer, buffer_cf = channel_buffer(buffer, (len(format_tables[out]), *data_cf.shape[1:]), dtype, channel_axis)
+
+    comps = [data_cf[ch].imag if is_imag else data_cf[ch].real for ch, is_imag in format_sources[in_format]]
+    write_components(comps, out, buffer_cf)
+    return buffer
+
+
+def as_format_torch(data:torch.Tensor, out:str='save_space', buffer:torch.Tensor=None, channel_axis=None)->torch.Tensor:
+    ''' Torch version of as_format(), with the same semantics, the output 
+    is on the same device as the input
+
+    Args:
+        data (Tensor): C3 or T3 data in any storage mode
+        out (str): output storage mode. Default: 'save_space'
+        buffer (Tensor): preallocated output tensor. Default: None
+        channel_axis (int): channel axis of the data and the buffer, None
+            means [..., channel, height, width]. Default: None
+
+    Returns:
+        transformed data
+    '''
+    channel_axis = check_channel_axis(data, channel_axis)
+    data_cf = data.movedim(channel_axis, 0)
+    in_format = get_format(data_cf)
+    if out not in format_tables:
+        raise LookupError('wrong out format')
+    if in_format == out:
+        if buffer is None:
+            return data
+        return buffer.copy_(data)
+
+    comps = [data_cf[ch].imag if is_imag else data_cf[ch].real for ch, is_imag in format_sources[in_format]]
+    buffer, buffer_cf = channel_buffer_torch(buffer, (len(format_tables[out]), *data_cf.shape[1:]), out, comps[0], channel_axis)
+    write_components_torch(comps, out, buffer_cf)
+    return buffer
+
+
+def rgb_by_c3(data:np.ndarray, type:str='pauli', is_print=False, if_mask=False, channel_axis=None)->np.ndarray:
     ''' Create the pseudo RGB image with covariance matrix
 
     Args:
-        data (ndarray): input polSAR data
+        data (ndarray): input polSAR data, batched data in [..., channel, 
+            height, width] shape is normalized image by image
         type (str): 'pauli' or 'sinclair'. Default: 'pauli'
         is_print (bool): if to print debug infos. Default: False
         if_mask (bool): for pauli RGB generation, if to set mask to the
             invalid data, preventing it from computing the upper and lower bound
+        channel_axis (int): channel axis of the data, None means [..., 
+            channel, height, width]. Default: None
 
     Returns:
-        RGB data in [0, 1]
+        RGB data in [0, 1], in [..., height, width, 3] shape
     '''
     type = type.lower()
-    data = as_format(data, out='complex_vector_6')
+    channel_axis = check_channel_axis(data, channel_axis)
+    data = np.moveaxis(as_format(data, out='complex_vector_6', channel_axis=channel_axis), channel_axis, 0)
+    axis = None if data.ndim == 3 else (-2, -1)
 
     # compute orginal RGB components
     if type == 'pauli':
         # print('test')
-        R = 0.5*(data[0, :, :]+data[5, :, :])-2*data[2, :, :].real
-        G = data[3, :, :]
-        B = 0.5*(data[0, :, :]+data[5, :, :])+2*data[2, :, :].real
+        R = 0.5*(data[0]+data[5])-2*data[2].real
+        G = data[3]
+        B = 0.5*(data[0]+data[5])+2*data[2].real
     elif type == 'sinclair':
-        R = data[5, :, :]
-        G = data[3, :, :]
-        B = data[0, :, :]
+        R = data[5]
+        G = data[3]
+        B = data[0]
 
     # print(R, '\n')
     # abs
@@ -670,12 +1973,12 @@ def rgb_by_c3(data:np.ndarray, type:str='pauli', is_print=False, if_mask=False)-
         B_mask = B > -150
 
     # normalize
-    R = mathlib.min_max_contrast_median_map(R, mask=R_mask, is_print=is_print)
-    G = mathlib.min_max_contrast_median_map(G, mask=G_mask, is_print=is_print)
-    B = mathlib.min_max_contrast_median_map(B, mask=B_mask, is_print=is_print)
+    R = mathlib.min_max_contrast_median_map(R, mask=R_mask, is_print=is_print, axis=axis)
+    G = mathlib.min_max_contrast_median_map(G, mask=G_mask, is_print=is_print, axis=axis)
+    B = mathlib.min_max_contrast_median_map(B, mask=B_mask, is_print=is_print, axis=axis)
 
     # print(R.shape, G.shape, B.shape)
-    return np.stack((R, G, B), axis=2)
+    return np.stack((R, G, B), axis=-1)
 
 
 def gray_by_intensity(data:np.ndarray, type='3sigma', if_log=True, is_print=False)->np.ndarray:
@@ -961,11 +2264,12 @@ def exact_patch_s2(src_path, roi, dst_path=None, if_mask=False):
     iu.save_image_by_cv2(pauli_roi, osp.join(dst_path, 'pauliRGB.png'), if_norm=False)
 
 
-def split_patch(path, patch_size=[512, 512], transpose=False)->None:
+def split_patch(path, patch_size=[512, 512], transpose=False, num_workers=4)->None:
     ''' 
     split the who image into several patches 
     @in     -path           -path to C3 data
             -patch_size     -size of a patch, in [height, width] format
+            -num_workers    -number of threads writing the patches, see PatchWriter
     '''
     print('working dir : ', path)
     whole_config = read_hdr(path)
@@ -974,59 +2278,56 @@ def split_patch(path, patch_size=[512, 512], transpose=False)->None:
     whole_img = read_bmp(path)
     if whole_img is None:           #没有 pauliRGB 的话就生成
         whole_img = rgb_by_c3(whole_data)*255
-        whole_img = cv2.cvtColor(whole_img.astype(np.uint8), cv2.COLOR_RGB2BGR)
-        cv2.imwrite(osp.join(path, 'PauliRGB.bmp'), whole_img)
-    if transpose:
-        whole_data = whole_data.transpose((0, 2, 1))
-        whole_img = rgb_by_c3(whole_data)*255
-        whole_img = cv2.cvtColor(whole_img.astype(np.uint8), cv2.COLOR_RGB2BGR)
-        cv2.imwrite(osp.join(path, 'PauliRGB.bmp'), whole_img)
-        tmp = whole_config['lines']
-        whole_config['lines'] = whole_config['samples']
-        whole_config['samples'] = tmp
-        write_c3(path, whole_data, whole_config, is_print=True)
-        cv2.imwrite(osp.join(path, 'PauliRGB.bmp'), whole_img)
-    whole_het, whole_wes = whole_img.shape[:2]
-    idx = 0
-    start_x = 0
-    start_y = 0
-    p_het, p_wes = patch_size
-    whole_config['samples'] = '512'
-    whole_config['lines'] = '512'
-    while start_x<whole_wes and start_y<whole_het:
-        print(f'    spliting the {idx}-th patch')
-
-        # write bin file
-        p_data = whole_data[:, start_y:start_y+p_het, start_x:start_x+p_wes]
-        p_folder = osp.join(path, str(idx))
-        fu.mkdir_if_not_exist(p_folder)
-        write_c3(p_folder, p_data, whole_config, is_print=True)
-
-        # write pauliRGB, which is cutted from big picture, not re-generated 
-        p_img = whole_img[start_y:start_y+p_het, start_x:start_x+p_wes, :]
-        cv2.imwrite(osp.join(p_folder, 'PauliRGB.bmp'), p_img)
-
-        # increase patch index
-        idx += 1
-        start_x += p_wes
-        if start_x >= whole_wes:      # next row
-            start_x = 0
-            start_y += p_het
-            if start_y>=whole_het:          # finish
-                print('totle split', idx, 'patches done')
-                return
-            elif start_y+p_het > whole_het: # suplement
-                start_y = whole_het - p_het
-        elif start_x+p_wes > whole_wes: 
-            start_x = whole_wes - p_wes      
-
-
-def split_patch_s2(path, patch_size=(512, 512), transpose=False)->None:
+        whole_img = cv2.cvtColor(whole_img.astype(np.uint8), cv2.COLOR_RGB2BGR)
+        cv2.imwrite(osp.join(path, 'PauliRGB.bmp'), whole_img)
+    if transpose:
+        whole_data = whole_data.transpose((0, 2, 1))
+        whole_img = rgb_by_c3(whole_data)*255
+        whole_img = cv2.cvtColor(whole_img.astype(np.uint8), cv2.COLOR_RGB2BGR)
+        cv2.imwrite(osp.join(path, 'PauliRGB.bmp'), whole_img)
+        tmp = whole_config['lines']
+        whole_config['lines'] = whole_config['samples']
+        whole_config['samples'] = tmp
+        write_c3(path, whole_data, whole_config, is_print=True)
+        cv2.imwrite(osp.join(path, 'PauliRGB.bmp'), whole_img)
+    whole_het, whole_wes = whole_img.shape[:2]
+    idx = 0
+    start_x = 0
+    start_y = 0
+    p_het, p_wes = patch_size
+    with PatchWriter(num_workers=num_workers, is_print=True) as writer:
+        while start_x<whole_wes and start_y<whole_het:
+            print(f'    spliting the {idx}-th patch')
+
+            # write bin file, and pauliRGB, which is cutted from big picture, not re-generated 
+            p_data = whole_data[:, start_y:start_y+p_het, start_x:start_x+p_wes]
+            p_img = whole_img[start_y:start_y+p_het, start_x:start_x+p_wes, :]
+            p_folder = osp.join(path, str(idx))
+            p_config = dict(whole_config, lines=str(p_data.shape[1]), samples=str(p_data.shape[2]))
+            writer.write(p_folder, p_data, 'c3', p_config, images={'PauliRGB.bmp': p_img})
+
+            # increase patch index
+            idx += 1
+            start_x += p_wes
+            if start_x >= whole_wes:      # next row
+                start_x = 0
+                start_y += p_het
+                if start_y>=whole_het:          # finish
+                    break
+                elif start_y+p_het > whole_het: # suplement
+                    start_y = whole_het - p_het
+            elif start_x+p_wes > whole_wes: 
+                start_x = whole_wes - p_wes      
+    print('totle split', idx, 'patches done')
+
+
+def split_patch_s2(path, patch_size=(512, 512), transpose=False, num_workers=4)->None:
     ''' 
     split the who image into several patches 
     @in     -path           -path to s2 data
             -patch_size     -size of a patch, in [height, width] format
             -tranpose       -whether to transpose the spatial axes of data
+            -num_workers    -number of threads writing the patches, see PatchWriter
     '''
     path = check_s2_path(path)
     print('spliting the dir: ', path)
@@ -1056,32 +2357,29 @@ def split_patch_s2(path, patch_size=(512, 512), transpose=False)->None:
     p_het, p_wes = patch_size
     whole_cfg['Nrow'] = '512'
     whole_cfg['Ncol'] = '512'
-    while start_x<whole_wes and start_y<whole_het:
-        print(f'    spliting the {idx}-th patch')
-
-        # write bin file
-        p_data = whole_data[:, start_y:start_y+p_het, start_x:start_x+p_wes]
-        p_folder = osp.join(path, str(idx))
-        fu.mkdir_if_not_exist(p_folder)
-        write_s2(p_folder, p_data, whole_cfg, is_print=True)
-
-        # write pauliRGB, which is cutted from big picture, not re-generated 
-        p_img = whole_img[start_y:start_y+p_het, start_x:start_x+p_wes, :]
-        cv2.imwrite(osp.join(p_folder, 'PauliRGB.bmp'), p_img)
-
-        # increase patch index
-        idx += 1
-        start_x += p_wes
-        if start_x >= whole_wes:      # next row
-            start_x = 0
-            start_y += p_het
-            if start_y>=whole_het:          # finish
-                print('totle split', idx, 'patches done')
-                return
-            elif start_y+p_het > whole_het: # suplement
-                start_y = whole_het - p_het
-        elif start_x+p_wes > whole_wes: 
-            start_x = whole_wes - p_wes   
+    with PatchWriter(num_workers=num_workers, is_print=True) as writer:
+        while start_x<whole_wes and start_y<whole_het:
+            print(f'    spliting the {idx}-th patch')
+
+            # write bin file, and pauliRGB, which is cutted from big picture, not re-generated 
+            p_data = whole_data[:, start_y:start_y+p_het, start_x:start_x+p_wes]
+            p_img = whole_img[start_y:start_y+p_het, start_x:start_x+p_wes, :]
+            p_folder = osp.join(path, str(idx))
+            writer.write(p_folder, p_data, 's2', whole_cfg, images={'PauliRGB.bmp': p_img})
+
+            # increase patch index
+            idx += 1
+            start_x += p_wes
+            if start_x >= whole_wes:      # next row
+                start_x = 0
+                start_y += p_het
+                if start_y>=whole_het:          # finish
+                    break
+                elif start_y+p_het > whole_het: # suplement
+                    start_y = whole_het - p_het
+            elif start_x+p_wes > whole_wes: 
+                start_x = whole_wes - p_wes   
+    print('totle split', idx, 'patches done')
 
 
 def split_patch_HAalpha(path, patch_size=[512, 512], transpose=False)->None:
@@ -1139,53 +2437,261 @@ def split_patch_HAalpha(path, patch_size=[512, 512], transpose=False)->None:
             start_x = whole_wes - p_wes    
 
 
-def Hokeman_decomposition(data:ndarray, if_scale=False)->ndarray:
-    ''' Calculate the Hokeman decomposition, which transforms the C3 matrix into 9 independent SAR intensities 
+def get_tile_coords(img_shape, tile=(512, 512), overlap=(0, 0))->list:
+    ''' Get the coordinates of the up left corners of all the tiles in a big
+    image, row by row. The tiles exceeding the bottom or right boundary are
+    moved back inside the image, the same as get_corrds_from_slice_idx() in
+    labelme_utils.py
 
     Args:
-        data (ndarray): data to be transformed, in [channel, height, width]
-            format
-        if_scale (bool): if to scale the data by 4*Pi. Default: False
+        img_shape (tuple): shape of the big image, in [height, width] format
+        tile (tuple): shape of the tile, in [height, width] format. Default:
+            (512, 512)
+        overlap (int or tuple): overlap of the adjacent tiles, in [height,
+            width] format. Default: (0, 0)
 
     Returns:
-        H (ndarray): transformed Hoekman coefficient, in [channel, height,
-            width] format
+        list of (y, x) coordinates
     '''
+    if isinstance(overlap, int):
+        overlap = (overlap, overlap)
+    img_het, img_wes = img_shape[:2]
+    if (img_het<tile[0]) or (img_wes<tile[1]):
+        raise ValueError('shape of image must greater than the tile')
+    if overlap[0]>=tile[0] or overlap[1]>=tile[1]:
+        raise ValueError('overlap must less than the tile')
+
+    starts = []
+    for length, size, ovlp in zip((img_het, img_wes), tile, overlap):
+        stride = size - ovlp
+        num = math.ceil((length-size) / stride) + 1
+        starts.append([min(ii*stride, length-size) for ii in range(num)])
+    return [(y, x) for y in starts[0] for x in starts[1]]
+
+
+def iter_tiles(path, tile=(512, 512), overlap=(0, 0), fmt='C3', out='save_space'):
+    ''' Iterate over the tiles of a memory-mapped scene, only one tile is
+    read into memory at a time
+
+    Args:
+        path (str): path to the scene, for 'HAalpha' format, it should be a
+            .npy file or a folder containing 'HAalpha.npy'
+        tile (tuple): shape of the tile, in [height, width] format. Default:
+            (512, 512)
+        overlap (int or tuple): overlap of the adjacent tiles, in [height,
+            width] format. Default: (0, 0)
+        fmt (str): 'C3', 'T3', 's2' or 'HAalpha'. Default: 'C3'
+        out (str): output format of C3 and T3 data, see as_format().
+            Default: 'save_space'
+
+    Yields:
+        coords (tuple): (y, x) coordinates of the up left corner of the tile
+        tile_data (ndarray): data of the tile in [channel, height, width]
+            shape
+    '''
+    if fmt == 'C3':
+        bands = memmap_c3(path)
+    elif fmt == 'T3':
+        bands = memmap_t3(path)
+    elif fmt == 's2':
+        bands = memmap_s2(path)
+    elif fmt == 'HAalpha':
+        if osp.isdir(path):
+            path = osp.join(path, 'HAalpha.npy')
+        bands = np.load(path, mmap_mode='r')
+    else:
+        raise NotImplementedError(f'unrecognized format: {fmt}')
+
+    p_het, p_wes = tile
+    for y, x in get_tile_coords(bands[0].shape, tile, overlap):
+        tile_data = np.empty((len(bands), p_het, p_wes), dtype=bands[0].dtype)
+        for ii, band in enumerate(bands):
+            tile_data[ii] = band[y:y+p_het, x:x+p_wes]
+        if fmt in ('C3', 'T3'):
+            tile_data = as_format(tile_data, out=out)
+        yield (y, x), tile_data
+
+
+# sensor names searched in the path of a catalog entry
+catalog_sensors = ['GF3', 'RS2', 'RADARSAT', 'AIRSAR', 'ALOS', 'TerraSAR', 
+                'Sentinel', 'UAVSAR', 'ESAR']
 
-    vb = np.array([[   1,   0,   0,    0,    0,   0,    0,   0,    0],
-                [   0,   1,   0,    0,    0,   0,    0,   0,    0],
-                [ 1/4, 1/4,   1,  1/2,    0,   1,    0,   1,    0],
-                [ 1/4, 1/4,   1,  1/2,    0,  -1,    0,  -1,    0],
-                [ 1/4, 1/4,   1, -1/2,    0,   0,   -1,   0,   -1],
-                [ 1/4, 1/4,   1, -1/2,    0,   0,    1,   0,    1],
-                [ 1/2,   0, 1/2,    0,    0,   1,    0,   0,    0],
-                [ 1/2,   0, 1/2,    0,    0,   0,   -1,   0,    0],
-                [ 1/4, 1/4, 1/2,    0, -1/2, 1/2, -1/2, 1/2, -1/2]], dtype=np.float32)
-    if if_scale:
-        vb *= 4 * np.pi
-
-    data = as_format(data, 'save_space')
-    data = data[[0,8,5,3,4,1,2,6,7], ...]
-    _, m, n = data.shape
-    H = (vb @ data.reshape(9, -1)).reshape(9, m, n)
-    # H *= 4*np.pi
-    # H[H<mathlib.eps] = mathlib.eps
-    return H
-
-
-def inverse_Hokeman_decomposition(data:ndarray, if_scale=False)->ndarray:
-    ''' Calculate inverse Hokeman decomposition, which transforms the 9 independent SAR intensities into C3 matrix 
+
+def detect_data_format(files)->str:
+    ''' Detect the PolSAR data format of a folder from its file names
 
     Args:
-        data (ndarray): Hoekman coefficient to be transformed, in [channel,
-            height, width] format
-        if_scale (bool): if to scale the data by 1/(4*Pi). Default: False
+        files (list): file names in the folder
 
     Returns:
-        C3 (ndarray): transformed C3 data, in 'save_space' data format
+        'C3', 'T3', 's2', 'HAalpha', or None if it is not a PolSAR folder
+    '''
+    files = set(files)
+    if 'C11.bin' in files and 'C11.bin.hdr' in files:
+        return 'C3'
+    elif 'T11.bin' in files and 'T11.bin.hdr' in files:
+        return 'T3'
+    elif 's11.bin' in files and 'config.txt' in files:
+        return 's2'
+    elif ('alpha.bin' in files and 'alpha.bin.hdr' in files) or 'unnormed.npy' in files or 'HAalpha.npy' in files:
+        return 'HAalpha'
+    return None
+
+
+def catalog_stamp_file(data_format:str, files)->str:
+    ''' File whose mtime stamps a PolSAR folder in the catalog, i.e. the 
+    file that the shape and data type are read from '''
+    if data_format in ('C3', 'T3'):
+        return data_format[0]+'11.bin.hdr'
+    elif data_format == 's2':
+        return 'config.txt'
+    elif 'alpha.bin' in files:
+        return 'alpha.bin.hdr'
+    return 'unnormed.npy' if 'unnormed.npy' in files else 'HAalpha.npy'
+
+
+def catalog_entry(path:str, data_format:str, files)->dict:
+    ''' Read the shape and data type of a PolSAR folder for the catalog
+
+    Args:
+        path (str): path of the folder
+        data_format (str): output of detect_data_format()
+        files (list): file names in the folder
+
+    Returns:
+        dict of the folder info
     '''
+    if data_format in ('C3', 'T3'):
+        meta_info = read_hdr(path, file=data_format[0]+'11.bin')
+        shape = [int(meta_info['lines']), int(meta_info['samples'])]
+        dtype = get_envi_dtype(meta_info).name
+    elif data_format == 's2':
+        meta_info = read_s2_config(path)
+        shape = [int(meta_info['Nrow']), int(meta_info['Ncol'])]
+        dtype = 'complex64'
+    elif 'alpha.bin' in files:
+        meta_info = read_hdr(path, file='alpha.bin')
+        shape = [int(meta_info['lines']), int(meta_info['samples'])]
+        dtype = get_envi_dtype(meta_info).name
+    else:
+        npy = np.load(osp.join(path, catalog_stamp_file(data_format, files)), mmap_mode='r')
+        shape = list(npy.shape[1:])
+        dtype = npy.dtype.name
+
+    sensor = None
+    for part in re.split(r'[\\/]', path):
+        for name in catalog_sensors:
+            if name.lower() in part.lower():
+                sensor = name
+                break
+        if sensor is not None:
+            break
+
+    name = osp.basename(path)
+    return {'format': data_format,
+            'shape': shape,
+            'dtype': dtype,
+            'sensor': sensor,
+            'patch_idx': int(name) if name.isdigit() else None,
+            'file_mtime': os.stat(osp.join(path, catalog_stamp_file(data_format, files))).st_mtime_ns,
+            }
+
+
+def build_catalog(root:str, index_file=None, num_workers=8, is_print=False)->dict:
+    ''' Build a catalog of all the C3, T3, s2 and HAalpha folders in a tree,
+    and persist it into a single json file. If the index file exists, it is
+    refreshed incrementally, i.e. the headers are only read for the folders
+    whose mtime or header mtime changed, the latter catches the headers 
+    rewritten in place, which do not change the mtime of the folder
+
+    Args:
+        root (str): root of the tree
+        index_file (str): path of the index file, None means 
+            'polsar_catalog.json' in the root. Default: None
+        num_workers (int): number of threads scanning the tree and reading
+            the headers. Default: 8
+        is_print (bool): whether to print the debug info. Default: False
+
+    Returns:
+        catalog (dict): {relative path of the folder: folder info}, folder 
+            info contains 'format', 'shape', 'dtype', 'sensor', 
+            'patch_idx', 'pyramid_levels' and the mtimes. The levels built 
+            by build_pyramid() are not catalogued as folders, but listed in
+            'pyramid_levels' of their scene
+    '''
+    root = osp.abspath(root)
+    if index_file is None:
+        index_file = osp.join(root, 'polsar_catalog.json')
+    old = load_catalog(index_file) if osp.isfile(index_file) else dict()
+
+    folders = []
+    pyramids = dict()
+    for dir_path, (mtime, files) in fu.scan_tree(root, num_workers=num_workers).items():
+        data_format = detect_data_format(files)
+        if data_format is None:
+            continue
+        parent, level = osp.split(dir_path)
+        if level.isdigit() and osp.basename(parent) == pyramid_folder:
+            pyramids.setdefault(osp.dirname(parent), []).append(int(level))
+            continue
+        folders.append((osp.relpath(dir_path, root), dir_path, mtime, data_format, files))
+
+    def refresh(args):
+        rel_path, dir_path, mtime, data_format, files = args
+        entry = old.get(rel_path)
+        if entry is not None and entry['dir_mtime'] == mtime and entry['format'] == data_format:
+            file_mtime = os.stat(osp.join(dir_path, catalog_stamp_file(data_format, files))).st_mtime_ns
+            if entry.get('file_mtime') == file_mtime:
+                return rel_path, entry, False
+        entry = catalog_entry(dir_path, data_format, files)
+        entry['dir_mtime'] = mtime
+        return rel_path, entry, True
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        results = list(pool.map(refresh, folders))
+    catalog = {rel_path: entry for rel_path, entry, _ in results}
+    for rel_path, dir_path, _, _, _ in folders:
+        catalog[rel_path]['pyramid_levels'] = sorted(pyramids.get(dir_path, []))
+    if is_print:
+        num_updated = sum(updated for _, _, updated in results)
+        print(f'catalog of {root}: {len(catalog)} folders, {num_updated} updated')
 
-    b = np.array([[    1,    0,    0,    0,    0,    0,  0,  0,  0],
+    # write the index file atomically
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'root': root, 'folders': catalog}, f)
+    os.replace(tmp_file, index_file)
+    return catalog
+
+
+def load_catalog(index_file:str)->dict:
+    ''' Load the catalog built by build_catalog()
+
+    Args:
+        index_file (str): path of the index file
+
+    Returns:
+        catalog (dict): {relative path of the folder: folder info}
+    '''
+    with open(index_file, 'r') as f:
+        return json.load(f)['folders']
+
+
+# transform matrix of Hoekman decomposition, from C3 in the order of c11, 
+# c33, c22, c13_real, c13_imag, c12_real, c12_imag, c23_real, c23_imag
+hoekman_vb = np.array([[   1,   0,   0,    0,    0,   0,    0,   0,    0],
+                    [   0,   1,   0,    0,    0,   0,    0,   0,    0],
+                    [ 1/4, 1/4,   1,  1/2,    0,   1,    0,   1,    0],
+                    [ 1/4, 1/4,   1,  1/2,    0,  -1,    0,  -1,    0],
+                    [ 1/4, 1/4,   1, -1/2,    0,   0,   -1,   0,   -1],
+                    [ 1/4, 1/4,   1, -1/2,    0,   0,    1,   0,    1],
+                    [ 1/2,   0, 1/2,    0,    0,   1,    0,   0,    0],
+                    [ 1/2,   0, 1/2,    0,    0,   0,   -1,   0,    0],
+                    [ 1/4, 1/4, 1/2,    0, -1/2, 1/2, -1/2, 1/2, -1/2]], dtype=np.float32)
+
+# inverse transform matrix of Hoekman decomposition, the output is in the 
+# same order as the input of hoekman_vb
+hoekman_b = np.array([[    1,    0,    0,    0,    0,    0,  0,  0,  0],
                     [    0,    1,    0,    0,    0,    0,  0,  0,  0],
                     [ -1/4, -1/4,  1/4,  1/4,  1/4,  1/4,  0,  0,  0],
                     [    0,    0,  1/2,  1/2, -1/2, -1/2,  0,  0,  0],
@@ -1194,17 +2700,875 @@ def inverse_Hokeman_decomposition(data:ndarray, if_scale=False)->ndarray:
                     [  3/8, -1/8,  1/8,  1/8,  1/8,  1/8,  0, -1,  0],
                     [  3/8, -1/8,  5/8, -3/8,  1/8,  1/8, -1,  0,  0],
                     [ -3/8,  1/8, -1/8, -1/8, -5/8,  3/8,  0,  1,  0]], dtype=np.float32)
-    if if_scale:
-        b /= 4 * np.pi
 
-    _, m, n = data.shape
-    C3 = b @ data.reshape(9, -1)
-    C3 = C3.reshape(9, m, n)
-    # C3[C3<mathlib.eps] = mathlib.eps
-    # C3 = 4*np.pi
-    C3 = C3[[0, 5, 6, 3, 4, 2, 7, 8, 1], ...]
 
-    return C3
+# the matrices above with the channel permutations folded in, so that they
+# are applied to and give the real components in 'save_space' order directly
+hoekman_matrix = np.zeros_like(hoekman_vb)
+hoekman_matrix[:, [0,8,5,3,4,1,2,6,7]] = hoekman_vb
+inverse_hoekman_matrix = hoekman_b[[0, 5, 6, 3, 4, 2, 7, 8, 1]]
+
+
+def apply_channel_matrix(matrix:ndarray, comps:list, buffer:ndarray, block_rows=64):
+    ''' Linear combination of the channels, i.e. buffer[i] = sum_k 
+    matrix[i, k] * comps[k], computed row block by row block, each block is
+    gathered into a small contiguous array and multiplied by BLAS
+
+    Args:
+        matrix (ndarray): combination matrix
+        comps (list): input channels, each in [..., height, width] shape
+        buffer (ndarray): channel-first output, in [channel, ..., height, 
+            width] shape
+        block_rows (int): number of rows of a block, a block should fit in
+            the cache. Default: 64
+    '''
+    h = buffer.shape[-2]
+    matrix = matrix.astype(buffer.dtype, copy=False)
+    block_shape = (*comps[0].shape[:-2], min(block_rows, h), comps[0].shape[-1])
+    block = np.empty((len(comps), *block_shape), dtype=buffer.dtype)
+    result = np.empty((len(matrix), *block_shape), dtype=buffer.dtype)
+    for row0 in range(0, h, block_rows):
+        rows = slice(row0, min(row0+block_rows, h))
+        n = rows.stop - rows.start
+        for k, comp in enumerate(comps):
+            block[k][..., :n, :] = comp[..., rows, :]
+        np.matmul(matrix, block.reshape(len(comps), -1), out=result.reshape(len(matrix), -1))
+        buffer[..., rows, :] = result[..., :n, :]
+
+
+def Hokeman_decomposition(data:ndarray, if_scale=False, channel_axis=None, buffer:ndarray=None, block_rows=64)->ndarray:
+    ''' Calculate the Hokeman decomposition, which transforms the C3 matrix into 9 independent SAR intensities 
+
+    The real components are read from any storage mode directly, and 
+    combined by hoekman_matrix row block by row block, without converting 
+    to 'save_space' format first.
+
+    Args:
+        data (ndarray | list | Tensor): data to be transformed, in [channel,
+            height, width] format, or with leading batch axes, e.g. [N, 
+            channel, height, width], or list of bands like the output of 
+            memmap_c3()
+        if_scale (bool): if to scale the data by 4*Pi. Default: False
+        channel_axis (int): channel axis of the data, None means [..., 
+            channel, height, width]. Default: None
+        buffer (ndarray): preallocated output array, which can be a 
+            np.memmap for a whole scene. Default: None
+        block_rows (int): number of rows of a block. Default: 64
+
+    Returns:
+        H (ndarray): transformed Hoekman coefficient, in [channel, height,
+            width] format
+    '''
+
+    matrix = hoekman_matrix * (4 * np.pi) if if_scale else hoekman_matrix
+    if isinstance(data, torch.Tensor):
+        channel_axis = check_channel_axis(data, channel_axis)
+        data = as_format_torch(data, 'save_space', channel_axis=channel_axis).movedim(channel_axis, 0)
+        matrix = torch.from_numpy(matrix).to(dtype=data.dtype, device=data.device)
+        return torch.tensordot(matrix, data, dims=1).movedim(0, channel_axis)
+
+    if isinstance(data, ndarray):
+        channel_axis = check_channel_axis(data, channel_axis)
+        data = np.moveaxis(data, channel_axis, 0)
+    else:
+        channel_axis = 0
+    comps = [data[ch].imag if is_imag else data[ch].real for ch, is_imag in format_sources[get_format(data)]]
+    buffer, buffer_cf = channel_buffer(buffer, (9, *comps[0].shape), mathlib.float_dtype(comps[0].dtype), channel_axis)
+    apply_channel_matrix(matrix, comps, buffer_cf, block_rows=block_rows)
+    return buffer
+
+
+def inverse_Hokeman_decomposition(data:ndarray, if_scale=False, channel_axis=None, buffer:ndarray=None, block_rows=64)->ndarray:
+    ''' Calculate inverse Hokeman decomposition, which transforms the 9 independent SAR intensities into C3 matrix 
+
+    Args:
+        data (ndarray | Tensor): Hoekman coefficient to be transformed, in 
+            [channel, height, width] format, or with leading batch axes
+        if_scale (bool): if to scale the data by 1/(4*Pi). Default: False
+        channel_axis (int): channel axis of the data, None means [..., 
+            channel, height, width]. Default: None
+        buffer (ndarray): preallocated output array. Default: None
+        block_rows (int): number of rows of a block. Default: 64
+
+    Returns:
+        C3 (ndarray): transformed C3 data, in 'save_space' data format
+    '''
+
+    matrix = inverse_hoekman_matrix / (4 * np.pi) if if_scale else inverse_hoekman_matrix
+    channel_axis = check_channel_axis(data, channel_axis)
+    if isinstance(data, torch.Tensor):
+        matrix = torch.from_numpy(matrix).to(dtype=data.dtype, device=data.device)
+        return torch.tensordot(matrix, data.movedim(channel_axis, 0), dims=1).movedim(0, channel_axis)
+
+    data = np.moveaxis(data, channel_axis, 0)
+    buffer, buffer_cf = channel_buffer(buffer, data.shape, mathlib.float_dtype(data.dtype), channel_axis)
+    apply_channel_matrix(matrix, list(data), buffer_cf, block_rows=block_rows)
+    return buffer
+
+
+def box_bounds(n:int, window:int, step:int)->tuple:
+    ''' Start and end indices of the boxes of a boxcar filter along an axis,
+    the i-th box is centered on [i*step, (i+1)*step), and is clipped by the
+    border
+
+    Args:
+        n (int): length of the axis
+        window (int): size of the box
+        step (int): decimation step
+
+    Returns:
+        start and end indices, each in [n//step] shape
+    '''
+    start = np.arange(n // step) * step + (step - window) // 2
+    return np.clip(start, 0, n), np.clip(start + window, 0, n)
+
+
+def boxcar_filter(data:ndarray, window=7, decimate=1, buffer:ndarray=None, block_rows=256, num_workers=0)->ndarray:
+    ''' Boxcar filter by summed-area tables, the cost does not depend on the
+    window size
+
+    As the boxcar filter is linear, it works on any storage mode of C3 and 
+    T3, and any other multi-channel data. The image is processed in row 
+    blocks, each with a halo of half the window, the boxes are clipped by 
+    the image border and averaged over the valid pixels. The summed-area 
+    tables are accumulated in double precision.
+
+    Args:
+        data (ndarray | list): data in [..., channel, height, width] shape,
+            or list of bands like the output of memmap_c3()
+        window (int | tuple): window size in (row, column) direction. 
+            Default: 7
+        decimate (int | tuple): decimation step in (row, column) direction,
+            the output pixel i is centered on the input pixels [i*step, 
+            (i+1)*step), e.g. window=decimate=3 gives a 3x3 multilook. 
+            Default: 1
+        buffer (ndarray): preallocated output array. Default: None
+        block_rows (int): number of output rows of a block. Default: 256
+        num_workers (int): number of threads to process the blocks at the
+            same time, 0 means sequentially. Default: 0
+
+    Returns:
+        filtered data in [..., channel, height//step, width//step] shape
+    '''
+
+    if isinstance(window, int):
+        window = (window, window)
+    if isinstance(decimate, int):
+        decimate = (decimate, decimate)
+    if isinstance(data, ndarray):
+        bands = data.reshape(-1, *data.shape[-2:])
+        lead_shape = data.shape[:-2]
+    else:
+        bands = data
+        lead_shape = (len(data), )
+    h, w = bands[0].shape
+    rows0, rows1 = box_bounds(h, window[0], decimate[0])
+    cols0, cols1 = box_bounds(w, window[1], decimate[1])
+
+    dtype = mathlib.float_dtype(bands[0].dtype, is_complex=np.iscomplexobj(bands[0]))
+    if buffer is None:
+        buffer = np.empty((*lead_shape, len(rows0), len(cols0)), dtype=dtype)
+    out = buffer.reshape(-1, len(rows0), len(cols0))
+    count = (rows1 - rows0)[:, None] * (cols1 - cols0)[None, :]
+
+    def filter_block(row0, row1):
+        # input rows of the block, including the halo
+        in0, in1 = rows0[row0:row1].min(), rows1[row0:row1].max()
+        r0, r1 = rows0[row0:row1] - in0, rows1[row0:row1] - in0
+        cnt = count[row0:row1]
+        for ii, band in enumerate(bands):
+            block = np.asarray(band[in0:in1, :])
+
+            # the summed-area table is separable, sum the rows of the boxes
+            # first, and then the columns
+            sat = np.zeros((in1-in0+1, w), dtype=np.result_type(block.dtype, np.float64))
+            np.cumsum(block, axis=0, out=sat[1:])
+            rows = np.zeros((row1-row0, w+1), dtype=sat.dtype)
+            np.subtract(sat[r1], sat[r0], out=rows[:, 1:])
+            np.cumsum(rows[:, 1:], axis=1, out=rows[:, 1:])
+            box = np.take(rows, cols1, axis=1) - np.take(rows, cols0, axis=1)
+            np.divide(box, cnt, out=out[ii, row0:row1], casting='same_kind')
+
+    run_row_blocks(filter_block, len(rows0), block_rows, num_workers)
+    return buffer
+
+
+def multilook(data:ndarray, looks=2, **kwargs)->ndarray:
+    ''' Multilook by averaging non-overlapping windows, the remainder rows 
+    and columns are dropped, see boxcar_filter() for the other arguments
+
+    Args:
+        data (ndarray | list): data in [..., channel, height, width] shape
+        looks (int | tuple): number of looks in (row, column) direction. 
+            Default: 2
+    '''
+    return boxcar_filter(data, window=looks, decimate=looks, **kwargs)
+
+
+def refined_lee_masks(window:int)->list:
+    ''' The 8 edge-aligned windows of the Refined Lee filter, in the order of
+    right, upper-right, top, upper-left, left, lower-left, bottom, 
+    lower-right, i.e. mask[d] and mask[d+4] are the two sides of an edge in
+    direction d, each is normalized as an averaging kernel '''
+    k, l = np.mgrid[:window, :window]
+    c = window // 2
+    masks = [l >= c, l >= k, k <= c, k + l <= window - 1, 
+            l <= c, l <= k, k >= c, k + l >= window - 1]
+    return [mask / mask.sum() for mask in masks]
+
+
+def refined_lee_block(block:ndarray, window:int, looks:float)->ndarray:
+    ''' Refined Lee filter of a padded block
+
+    Args:
+        block (ndarray): real components of C3 or T3 in 'save_space' order,
+            in [9, height+window-1, width+window-1] shape, i.e. with a halo 
+            of window//2 pixels on each side
+        window (int): window size
+        looks (float): number of looks of the data
+
+    Returns:
+        filtered block without the halo
+    '''
+    hw = window // 2
+    _, hp, wp = block.shape
+    h, w = hp - 2*hw, wp - 2*hw
+    step = (window - 1) // 3
+    sub = window - 2 * step
+    dtype = block.dtype
+    def crop(img, dy=0, dx=0):
+        return img[hw+dy:hw+dy+h, hw+dx:hw+dx+w]
+
+    # 3x3 means of sub-windows of the span image
+    span = block[0] + block[5] + block[8]
+    sub_mean = cv2.blur(span, (sub, sub))
+    m = [[crop(sub_mean, (ii-1)*step, (jj-1)*step) for jj in range(3)] for ii in range(3)]
+
+    # edge direction by the maximum gradient, and the side closer to the 
+    # center
+    grads = np.stack([np.abs(m[0][2] + m[1][2] + m[2][2] - m[0][0] - m[1][0] - m[2][0]),
+                    np.abs(m[0][1] + m[0][2] + m[1][2] - m[1][0] - m[2][0] - m[2][1]),
+                    np.abs(m[0][0] + m[0][1] + m[0][2] - m[2][0] - m[2][1] - m[2][2]),
+                    np.abs(m[0][0] + m[0][1] + m[1][0] - m[1][2] - m[2][1] - m[2][2])])
+    direction = grads.argmax(axis=0)
+    sides = [(m[1][2], m[1][0]), (m[0][2], m[2][0]), (m[0][1], m[2][1]), (m[0][0], m[2][2])]
+    far = np.zeros((h, w), dtype=bool)
+    for d, (side0, side1) in enumerate(sides):
+        far |= (direction == d) & (np.abs(side1 - m[1][1]) < np.abs(side0 - m[1][1]))
+    selected = direction + 4 * far
+
+    # local statistics of the span in the selected window, and the weight
+    masks = refined_lee_masks(window)
+    mean = np.zeros((h, w), dtype=dtype)
+    mean2 = np.zeros((h, w), dtype=dtype)
+    for d, mask in enumerate(masks):
+        hit = selected == d
+        mean[hit] = crop(cv2.filter2D(span, -1, mask))[hit]
+        mean2[hit] = crop(cv2.filter2D(span*span, -1, mask))[hit]
+    var_y = np.maximum(mean2 - mean*mean, 0)
+    sigma2 = 1 / looks
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = (var_y - mean*mean*sigma2) / (var_y * (1 + sigma2))
+    b = np.clip(np.nan_to_num(b), 0, 1)
+
+    out = np.empty((9, h, w), dtype=dtype)
+    for ch in range(9):
+        for d, mask in enumerate(masks):
+            hit = selected == d
+            out[ch][hit] = crop(cv2.filter2D(block[ch], -1, mask))[hit]
+        out[ch] += b * (crop(block[ch]) - out[ch])
+    return out
+
+
+def refined_lee_filter(data:ndarray, window=7, looks=1, buffer:ndarray=None, block_rows=256, num_workers=0)->ndarray:
+    ''' Refined Lee filter of C3 or T3 data, by J.S. Lee, "Polarimetric SAR
+    speckle filtering and its implication for classification"
+
+    The edge direction and the edge-aligned window of each pixel are 
+    selected on the span image, and all the elements of the covariance 
+    matrix are filtered with the same window and weight. The image is 
+    processed in row blocks with a halo of half the window, reflected at 
+    the image border, each block is vectorized by cv2.filter2D().
+
+    Args:
+        data (ndarray | list): C3 or T3 data in any storage mode, or list 
+            of bands like the output of memmap_c3()
+        window (int): window size, an odd number no less than 5. Default: 7
+        looks (float): number of looks of the data. Default: 1
+        buffer (ndarray): preallocated output array in 'save_space' 
+            format. Default: None
+        block_rows (int): number of rows of a block. Default: 256
+        num_workers (int): number of threads to process the blocks at the
+            same time, 0 means sequentially. Default: 0
+
+    Returns:
+        filtered data in 'save_space' format
+    '''
+
+    if window < 5 or window % 2 == 0:
+        raise ValueError(f'window size should be an odd number no less than 5, got {window}')
+    hw = window // 2
+    real_dtype = mathlib.float_dtype(data[0].dtype)
+    h, w = data[0].shape
+    if buffer is None:
+        buffer = np.empty((9, h, w), dtype=real_dtype)
+
+    def filter_block(row0, row1):
+        in0, in1 = max(row0 - hw, 0), min(row1 + hw, h)
+        block = np.stack(gather_components(data, in0, in1, real_dtype))
+        pad = ((0, 0), (hw - (row0 - in0), hw - (in1 - row1)), (hw, hw))
+        block = np.pad(block, pad, mode='reflect')
+        buffer[:, row0:row1, :] = refined_lee_block(block, window, looks)
+
+    run_row_blocks(filter_block, h, block_rows, num_workers)
+    return buffer
+
+
+def write_refined_lee(path:str, dst_path:str, data_format='C3', is_print=False, **kwargs)->None:
+    ''' Refined Lee filter a C3 or T3 folder, and write the result through 
+    write_c3() or write_t3(), see refined_lee_filter() for the other 
+    arguments
+
+    Args:
+        path (str): path of C3 or T3 data, which is memory-mapped
+        dst_path (str): path of the filtered data, created if not exist
+        data_format (str): 'C3' or 'T3'. Default: 'C3'
+        is_print (bool): whether to print the debug info. Default: False
+    '''
+    if data_format == 'C3':
+        data = memmap_c3(path)
+    elif data_format == 'T3':
+        data = memmap_t3(path)
+    else:
+        raise NotImplementedError(f'Refined Lee filter of {data_format} is not supported')
+    if is_print:
+        print('filtering ', path)
+
+    filtered = refined_lee_filter(data, **kwargs)
+    fu.mkdir_if_not_exist(dst_path)
+    if data_format == 'C3':
+        write_c3(dst_path, filtered, is_print=is_print)
+    else:
+        write_t3(dst_path, filtered, is_print=is_print)
+
+
+pyramid_folder = 'pyramid'
+
+
+def pyramid_path(path:str, level:int, data_format='C3')->str:
+    ''' Folder of a level of the quick-look pyramid, level 0 is the data
+    itself '''
+    if data_format == 'C3':
+        path = check_c3_path(path)
+    if level == 0:
+        return path
+    return osp.join(path, pyramid_folder, str(level))
+
+
+def build_pyramid(path:str, data_format='C3', thumb_size=512, block_rows=256, num_workers=0, is_print=False)->list:
+    ''' Build a quick-look pyramid of a C3 or T3 scene, level k is the 
+    2^k x 2^k multilooked data, the levels go down until the larger side 
+    is not larger than "thumb_size"
+
+    The scene is memory-mapped and read only once, each row block is 
+    averaged 2x2 level by level and written into the memory-mapped level 
+    files, which are stored in the "pyramid/<level>" subfolders of the 
+    data folder, in the same layout as the data itself. The remainder rows
+    and columns of each level are dropped, as multilook() does.
+
+    Args:
+        path (str): path of C3 or T3 data
+        data_format (str): 'C3' or 'T3'. Default: 'C3'
+        thumb_size (int): maximum size of the coarsest level. Default: 512
+        block_rows (int): number of rows of a block, rounded down to a 
+            multiple of 2^levels. Default: 256
+        num_workers (int): number of threads to process the blocks at the
+            same time, 0 means sequentially. Default: 0
+        is_print (bool): whether to print the debug info. Default: False
+
+    Returns:
+        list of the level folders, from level 1 to the coarsest one
+    '''
+    if data_format == 'C3':
+        path = check_c3_path(path)
+        data = memmap_c3(path)
+        bin_files, data_type = c3_bin_files, 'c3'
+    elif data_format == 'T3':
+        data = memmap_t3(path)
+        bin_files, data_type = t3_bin_files, 't3'
+    else:
+        raise NotImplementedError(f'pyramid of {data_format} is not supported')
+    h, w = data[0].shape
+    if min(h, w) < 2:
+        raise ValueError(f'can not build pyramid of {h}x{w} data')
+
+    num_levels = 1
+    while max(h, w) >> num_levels > thumb_size and min(h, w) >> (num_levels+1) > 0:
+        num_levels += 1
+    unit = 2 ** num_levels
+    block_rows = max(unit, block_rows // unit * unit)
+
+    level_paths = []
+    levels = []
+    for level in range(1, num_levels+1):
+        level_path = pyramid_path(path, level, data_format)
+        shape = (h >> level, w >> level)
+        if is_print:
+            print(f'level {level}: {shape[0]}x{shape[1]}, writing ', level_path)
+        fu.mkdir_if_not_exist(level_path)
+        write_config_hdr(level_path, shape, data_type=data_type)
+        level_paths.append(level_path)
+        levels.append(memmap_bins(level_path, bin_files, shape, mode='w+'))
+
+    def reduce_block(row0, row1):
+        block = np.stack([band[row0:row1, :] for band in data]).astype(np.float32, copy=False)
+        for level, bands in enumerate(levels, 1):
+            block = multilook_block(block, (2, 2))
+            start = row0 >> level
+            for band, reduced in zip(bands, block):
+                band[start:start+block.shape[1], :] = reduced
+
+    run_row_blocks(reduce_block, h, block_rows, num_workers)
+    for bands in levels:
+        for band in bands:
+            band.flush()
+    return level_paths
+
+
+def pyramid_levels(path:str, data_format='C3')->list:
+    ''' Levels of the quick-look pyramid built by build_pyramid(), in 
+    ascending order, an empty list if there is no pyramid '''
+    root = osp.join(pyramid_path(path, 0, data_format), pyramid_folder)
+    if not osp.isdir(root):
+        return []
+    return sorted(int(level) for level in os.listdir(root) if level.isdigit())
+
+
+def read_pyramid_level(path:str, level=-1, data_format='C3', out='complex_vector_6', window=None)->ndarray:
+    ''' Read a level of the quick-look pyramid, the output can be fed to 
+    rgb_by_c3() or rgb_by_t3() directly
+
+    Args:
+        path (str): path of C3 or T3 data
+        level (int): pyramid level, 0 means the data itself, negative 
+            values count from the coarsest level. Default: -1
+        data_format (str): 'C3' or 'T3'. Default: 'C3'
+        out (str): output format, see read_c3(). Default: 'complex_vector_6'
+        window (tuple or None): in the form of (row0, col0, h, w) of the 
+            level, None means the whole level. Default: None
+
+    Returns:
+        C3 or T3 data of the level, in [channel, height, width] shape
+    '''
+    if level < 0:
+        levels = [0] + pyramid_levels(path, data_format)
+        level = levels[level]
+    level_path = pyramid_path(path, level, data_format)
+    if data_format == 'C3':
+        return read_c3(level_path, out=out, window=window)
+    elif data_format == 'T3':
+        return read_t3(level_path, out=out, window=window)
+    else:
+        raise NotImplementedError(f'pyramid of {data_format} is not supported')
+
+
+def quick_look(path:str, max_size=1024, data_format='C3', type='pauli')->ndarray:
+    ''' Pseudo RGB image of the finest pyramid level whose larger side is 
+    not larger than "max_size", or of the coarsest level if none is, T3 
+    data is converted to C3 and goes through rgb_by_c3()
+
+    Args:
+        path (str): path of C3 or T3 data, whose pyramid is built
+        max_size (int): maximum size of the image. Default: 1024
+        data_format (str): 'C3' or 'T3'. Default: 'C3'
+        type (str): 'pauli' or 'sinclair'. Default: 'pauli'
+
+    Returns:
+        RGB data in [0, 1], in [height, width, 3] shape
+    '''
+    levels = [0] + pyramid_levels(path, data_format)
+    file = 'C11.bin' if data_format == 'C3' else 'T11.bin'
+    for level in levels:
+        meta_info = read_hdr(pyramid_path(path, level, data_format), file=file)
+        if max(int(meta_info['lines']), int(meta_info['samples'])) <= max_size:
+            break
+    data = read_pyramid_level(path, level, data_format)
+    if data_format == 'T3':
+        data = t32c3(t3=data)
+    return rgb_by_c3(data, type=type)
+
+
+def surface_double_powers(hh, vv, hhvv_real, hhvv_imag)->tuple:
+    ''' Surface and double-bounce powers from the covariance left after the
+    volume (and helix) scattering is removed, both solutions of the 
+    Freeman-Durden model are computed, and selected by the sign of 
+    Re(<Shh*Svv^*>)
+
+    Args:
+        hh, vv, hhvv_real, hhvv_imag (ndarray): remaining <|Shh|^2>, 
+            <|Svv|^2> and <Shh*Svv^*>
+
+    Returns:
+        surface and double-bounce powers
+    '''
+    det = hh*vv - hhvv_real**2 - hhvv_imag**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # surface dominant, alpha = -1
+        fd = det / (hh + vv + 2*hhvv_real)
+        fs = vv - fd
+        ps_surface = fs + ((hhvv_real + fd)**2 + hhvv_imag**2) / fs
+        pd_surface = 2 * fd
+
+        # double-bounce dominant, beta = 1
+        fs = det / (hh + vv - 2*hhvv_real)
+        fd = vv - fs
+        ps_double = 2 * fs
+        pd_double = fd + ((hhvv_real - fs)**2 + hhvv_imag**2) / fd
+
+    surface = hhvv_real >= 0
+    ps = np.nan_to_num(np.where(surface, ps_surface, ps_double), nan=0, posinf=0, neginf=0)
+    pd = np.nan_to_num(np.where(surface, pd_surface, pd_double), nan=0, posinf=0, neginf=0)
+    return ps, pd
+
+
+def freeman_block(c:list)->ndarray:
+    ''' Freeman-Durden 3-component decomposition of a block
+
+    Args:
+        c (list): real components of C3 in 'save_space' order
+
+    Returns:
+        surface, double-bounce and volume powers in [3, ...] shape
+    '''
+    c11, c12r, c12i, c13r, c13i, c22, c23r, c23i, c33 = c
+    span = c11 + c22 + c33
+
+    # volume scattering, c22 = 2<|Shv|^2>
+    fv = 1.5 * c22
+    hh, vv = c11 - fv, c33 - fv
+    ps, pd = surface_double_powers(hh, vv, c13r - fv/3, c13i)
+
+    # the volume scattering takes all the power if it is over-estimated
+    invalid = (hh <= 0) | (vv <= 0)
+    out = np.empty((3, *span.shape), dtype=span.dtype)
+    out[0] = np.where(invalid, 0, ps)
+    out[1] = np.where(invalid, 0, pd)
+    out[2] = np.where(invalid, span, 4 * c22)
+    return np.maximum(out, 0, out=out)
+
+
+def yamaguchi_block(c:list)->ndarray:
+    ''' Yamaguchi 4-component decomposition of a block, with the volume 
+    model selected by the ratio of <|Svv|^2> and <|Shh|^2>
+
+    Args:
+        c (list): real components of C3 in 'save_space' order
+
+    Returns:
+        surface, double-bounce, volume and helix powers in [4, ...] shape
+    '''
+    c11, c12r, c12i, c13r, c13i, c22, c23r, c23i, c33 = c
+    span = c11 + c22 + c33
+
+    # helix scattering, 2|Im<Shv^*(Shh-Svv)>|
+    pc = 2 ** 0.5 * np.abs(c12i + c23i)
+
+    # volume scattering, the asymmetric models are used if the ratio is 
+    # beyond +-2dB
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = 10 * np.log10(c33 / c11)
+    asymmetric = np.abs(np.nan_to_num(ratio)) > 2
+    hv = c22/2 - pc/4
+    fv = np.maximum(np.where(asymmetric, 7.5*hv, 8*hv), 0)
+    hh_v = np.where(asymmetric, np.where(ratio < 0, 8/15, 3/15), 3/8) * fv
+    vv_v = np.where(asymmetric, np.where(ratio < 0, 3/15, 8/15), 3/8) * fv
+    hhvv_v = np.where(asymmetric, 2/15, 1/8) * fv
+
+    hh, vv = c11 - hh_v - pc/4, c33 - vv_v - pc/4
+    ps, pd = surface_double_powers(hh, vv, c13r - hhvv_v + pc/4, c13i)
+
+    invalid = (hh <= 0) | (vv <= 0)
+    out = np.empty((4, *span.shape), dtype=span.dtype)
+    out[0] = np.where(invalid, 0, ps)
+    out[1] = np.where(invalid, 0, pd)
+    out[2] = np.where(invalid, span - pc, fv)
+    out[3] = pc
+    return np.maximum(out, 0, out=out)
+
+
+# blocks of the model-based decompositions, and their number of components
+model_blocks = {
+    'freeman': (freeman_block, 3),
+    'yamaguchi': (yamaguchi_block, 4),
+    }
+
+
+def model_based_decomposition(path:str=None, data:ndarray=None, src='C3', model='freeman', block_rows=256, num_workers=0)->ndarray:
+    ''' Model-based decomposition, the solutions of all the branches are 
+    computed as whole-array operations and selected by np.where()
+
+    Args:
+        path (str): path of C3 or T3 data, which is memory-mapped
+        data (ndarray | list): C3 or T3 data in any storage mode, or list 
+            of bands, should not be used if "path" is specified
+        src (str): 'C3' or 'T3'. Default: 'C3'
+        model (str): 'freeman' for Freeman-Durden 3-component, or 
+            'yamaguchi' for Yamaguchi 4-component. Default: 'freeman'
+        block_rows (int): number of rows of a block. Default: 256
+        num_workers (int): number of threads to process the blocks at the
+            same time, 0 means sequentially. Default: 0
+
+    Returns:
+        powers in [3, height, width] shape for 'freeman', i.e. surface, 
+        double-bounce and volume, and in [4, height, width] shape for 
+        'yamaguchi', with an additional helix component
+    '''
+
+    if src not in ('C3', 'T3'):
+        raise NotImplementedError(f'decomposition of {src} is not supported')
+    if model not in model_blocks:
+        raise NotImplementedError(f'unrecognized model: {model}')
+    block_func, channels = model_blocks[model]
+    if path is not None:
+        data = memmap_c3(path) if src == 'C3' else memmap_t3(path)
+    real_dtype = mathlib.float_dtype(data[0].dtype)
+    h, w = data[0].shape
+    powers = np.empty((channels, h, w), dtype=real_dtype)
+
+    def decompose_block(row0, row1):
+        block = gather_components(data, row0, row1, real_dtype)
+        if src == 'T3':
+            block = t3_to_c3_components(block)
+        powers[:, row0:row1, :] = block_func(block)
+
+    run_row_blocks(decompose_block, h, block_rows, num_workers)
+    return powers
+
+
+def freeman_decomposition(path:str=None, data:ndarray=None, src='C3', **kwargs)->ndarray:
+    ''' Freeman-Durden 3-component decomposition, see 
+    model_based_decomposition() '''
+    return model_based_decomposition(path, data, src=src, model='freeman', **kwargs)
+
+
+def yamaguchi_decomposition(path:str=None, data:ndarray=None, src='C3', **kwargs)->ndarray:
+    ''' Yamaguchi 4-component decomposition, see 
+    model_based_decomposition() '''
+    return model_based_decomposition(path, data, src=src, model='yamaguchi', **kwargs)
+
+
+def to_complex(real:ndarray, imag:ndarray)->ndarray:
+    ''' Combine the real and imaginary parts without the promotion of 1j* '''
+    out = np.empty(real.shape, dtype=mathlib.float_dtype(real.dtype, is_complex=True))
+    out.real = real
+    out.imag = imag
+    return out
+
+
+def eigvals_hermitian3(t:list)->tuple:
+    ''' Closed-form eigenvalues of 3x3 Hermitian matrices by the 
+    trigonometric solution of the characteristic polynomial
+
+    Args:
+        t (list): real components of the matrices in 'save_space' order
+
+    Returns:
+        eigenvalues in descending order
+    '''
+    t11, t12r, t12i, t13r, t13i, t22, t23r, t23i, t33 = t
+    q = (t11 + t22 + t33) / 3
+    a11, a22, a33 = t11 - q, t22 - q, t33 - q
+    n12 = t12r**2 + t12i**2
+    n13 = t13r**2 + t13i**2
+    n23 = t23r**2 + t23i**2
+    p = np.sqrt((a11**2 + a22**2 + a33**2 + 2*(n12 + n13 + n23)) / 6)
+
+    # det(T - q*I) / 2p^3, a zero p means a scalar matrix
+    re = (t12r*t23r - t12i*t23i)*t13r + (t12r*t23i + t12i*t23r)*t13i
+    det = a11*a22*a33 + 2*re - a11*n23 - a22*n13 - a33*n12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = det / (2 * p**3)
+    r = np.clip(np.nan_to_num(r, nan=0, posinf=0, neginf=0), -1, 1)
+
+    phi = np.arccos(r) / 3
+    l1 = q + 2*p*np.cos(phi)
+    l3 = q + 2*p*np.cos(phi + 2*np.pi/3)
+    l2 = 3*q - l1 - l3
+    return l1, l2, l3
+
+
+def eigvec_first_power(t:list, lam:ndarray, tol:ndarray)->ndarray:
+    ''' Squared magnitude of the first component of the normalized 
+    eigenvector, i.e. cos(alpha)^2, by the cross products of the rows of 
+    T - lambda*I, nan if the eigenvector is not unique
+
+    Args:
+        t (list): real components of the matrices in 'save_space' order
+        lam (ndarray): eigenvalue
+        tol (ndarray): squared norm threshold of a degenerate cross product
+    '''
+    t12, t13, t23 = to_complex(t[1], t[2]), to_complex(t[3], t[4]), to_complex(t[6], t[7])
+    d1, d2, d3 = t[0] - lam, t[5] - lam, t[8] - lam
+    crosses = [(t12*t23 - t13*d2, t13*t12.conj() - d1*t23, d1*d2 - np.abs(t12)**2),
+            (t12*d3 - t13*t23.conj(), np.abs(t13)**2 - d1*d3, d1*t23.conj() - t12*t13.conj()),
+            (d2*d3 - np.abs(t23)**2, t23*t13.conj() - t12.conj()*d3, t12.conj()*t23.conj() - d2*t13.conj())]
+
+    # use the cross product with the largest norm
+    first = np.zeros_like(d1)
+    norm = np.zeros_like(d1)
+    for cross in crosses:
+        first_ii = np.abs(cross[0])**2
+        norm_ii = first_ii + np.abs(cross[1])**2 + np.abs(cross[2])**2
+        larger = norm_ii > norm
+        first = np.where(larger, first_ii, first)
+        norm = np.where(larger, norm_ii, norm)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(norm > tol, first / norm, np.nan)
+
+
+def eigh_first_power(t:list, degenerate_tol:float)->tuple:
+    ''' Eigenvalues and cos(alpha)^2 of the eigenvectors of 3x3 Hermitian 
+    matrices by np.linalg.eigh(), for the matrices with close eigenvalues.
+    For degenerate eigenvalues, the basis of the eigenspace is chosen that 
+    one vector is the projection of the first axis, and the others are 
+    orthogonal to it, i.e. the cos(alpha)^2 of the eigenspace are merged 
+    into its first eigenvector
+
+    Args:
+        t (list): real components of the matrices in 'save_space' order, 
+            each in [n] shape
+        degenerate_tol (float): relative gap to the span below which the
+            eigenvalues are degenerate
+
+    Returns:
+        eigenvalues in descending order, and their cos(alpha)^2, both in 
+        [3, n] shape
+    '''
+    mat = as_format(np.stack(t)[:, None, :], out='complex_vector_9').reshape(3, 3, -1)
+    lams, vecs = np.linalg.eigh(mat.transpose(2, 0, 1))
+    lams = lams[:, ::-1].T.copy()
+    cos2 = (np.abs(vecs[:, 0, ::-1])**2).T.copy()
+    span = np.abs(lams).sum(axis=0)
+    for k in (2, 1):
+        degenerate = lams[k-1] - lams[k] <= degenerate_tol * span
+        cos2[k-1] += np.where(degenerate, cos2[k], 0)
+        cos2[k] = np.where(degenerate, 0, cos2[k])
+    return lams, cos2
+
+
+def HAalpha_block(t:list)->ndarray:
+    ''' H/A/alpha of a block of T3 matrices
+
+    The eigenvalues and eigenvectors are solved in closed form in double 
+    precision, the matrices with close eigenvalues, whose closed-form 
+    eigenvectors are inaccurate, are solved by np.linalg.eigh() instead.
+
+    Args:
+        t (list): real components of T3 in 'save_space' order
+
+    Returns:
+        entropy, anisotropy and alpha (in degree), in [3, ...] shape, in 
+        double precision
+    '''
+    t = [np.asarray(comp, dtype=np.float64) for comp in t]
+    eps = np.finfo(np.float64).eps
+    lams = list(eigvals_hermitian3(t))
+    span = np.abs(lams[0]) + np.abs(lams[1]) + np.abs(lams[2])
+
+    # the error of the closed-form eigenvalues is up to sqrt(eps)*span near
+    # a double root, and the error of the eigenvectors is the error of the
+    # eigenvalues over their gap, weighted by lambda/span in alpha. So the
+    # pairs whose gap is smaller than gap_tol*lambda are solved by eigh(), 
+    # unless lambda is negligible
+    gap_tol = 1e-4
+    significant = np.stack(lams) > 1e-6 * span
+    cos2 = np.stack([eigvec_first_power(t, lam, (100 * eps * span**2)**2) for lam in lams])
+    close = (np.isnan(cos2) & significant).any(axis=0)
+    for ii in (0, 1):
+        close |= (lams[ii] - lams[ii+1] < gap_tol * lams[ii]) & significant[ii]
+    lams = np.stack(lams)
+    if close.any():
+        lams[:, close], cos2[:, close] = eigh_first_power([comp[close] for comp in t], 100 * eps)
+
+    # the eigenvectors of negligible eigenvalues have no weight in alpha, 
+    # the first missing one takes the rest of cos(alpha)^2, which sum up 
+    # to 1
+    missing = np.isnan(cos2)
+    rest = np.clip(1 - np.nansum(cos2, axis=0), 0, 1)
+    first_missing = missing & (np.cumsum(missing, axis=0) == 1)
+    cos2 = np.where(missing, np.where(first_missing, rest, 0), np.clip(cos2, 0, 1))
+    lams = [np.maximum(lam, 0) for lam in lams]
+    span = lams[0] + lams[1] + lams[2]
+
+    out = np.empty((3, *span.shape), dtype=span.dtype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = [np.nan_to_num(lam / span) for lam in lams]
+        out[0] = -sum(np.where(p > 0, p * np.log(np.where(p > 0, p, 1)), 0) for p in probs) / np.log(3)
+        out[1] = np.nan_to_num((lams[1] - lams[2]) / (lams[1] + lams[2]))
+    out[2] = np.degrees(sum(p * np.arccos(np.sqrt(c)) for p, c in zip(probs, cos2)))
+    return out
+
+
+def HAalpha_decomposition(path:str=None, data:ndarray=None, src='T3', block_rows=256, num_workers=0)->ndarray:
+    ''' Cloude-Pottier H/A/alpha decomposition
+
+    The eigenvalues and the eigenvectors of the 3x3 Hermitian matrices are
+    computed in closed form for a row block at a time in double precision,
+    the matrices with close eigenvalues are solved by np.linalg.eigh(), see
+    HAalpha_block(). The output is in the precision of 
+    mathlib.float_dtype(), float32 by default.
+
+    Args:
+        path (str): path of C3 or T3 data, which is memory-mapped
+        data (ndarray | list): C3 or T3 data in any storage mode, or list 
+            of bands, should not be used if "path" is specified
+        src (str): 'C3' or 'T3'. Default: 'T3'
+        block_rows (int): number of rows of a block. Default: 256
+        num_workers (int): number of threads to process the blocks at the
+            same time, 0 means sequentially. Default: 0
+
+    Returns:
+        entropy, anisotropy and alpha (in degree), in [3, height, width] 
+        shape, the same as read_HAalpha()
+    '''
+
+    if src not in ('C3', 'T3'):
+        raise NotImplementedError(f'H/A/alpha decomposition of {src} is not supported')
+    if path is not None:
+        data = memmap_c3(path) if src == 'C3' else memmap_t3(path)
+    real_dtype = mathlib.float_dtype(data[0].dtype)
+    h, w = data[0].shape
+    HAalpha = np.empty((3, h, w), dtype=real_dtype)
+
+    def decompose_block(row0, row1):
+        block = gather_components(data, row0, row1, real_dtype)
+        if src == 'C3':
+            block = c3_to_t3_components(block)
+        HAalpha[:, row0:row1, :] = HAalpha_block(block)
+
+    run_row_blocks(decompose_block, h, block_rows, num_workers)
+    return HAalpha
+
+
+def write_HAalpha(path:str, data:ndarray, config=None, is_print=False):
+    ''' Write H/A/alpha data in the ENVI format read by read_HAalpha()
+
+    Args:
+        path (str): folder path, created if not exist
+        data (ndarray): entropy, anisotropy and alpha in [3, height, width]
+            shape
+        config (dict | tuple): config information of the .bin.hdr files. 
+            Default: None, i.e. the shape of the data
+        is_print (bool): whether to print the debug info. Default: False
+    '''
+    if is_print:
+        print('writing ', path)
+    fu.mkdir_if_not_exist(path)
+    if config is None:
+        config = data.shape[1:]
+    write_config_hdr(path, config, data_type='HAalpha')
+    for idx, bin in enumerate(HAalpha_bin_files):
+        data[idx].astype(np.float32, copy=False).tofile(osp.join(path, bin))
 
 
 def my_cholesky(M, dtype='torch'):
@@ -1246,15 +3610,18 @@ def wishart_noise(sigma, ENL: int=3):
 
     @in     -sigma      -original matix, in shape of [3, 3, len_]
     @in     -ENL        -equivalent number of looks
-    @ret    
+    @ret    -noise matrix in the same shape, in the complex data type of mathlib.float_dtype()
     '''
     h, w, len_ = sigma.shape
     if (h!=3) or (w!=3):
         raise ValueError('shape of a covariance matrix should be 3x3')
         
-    c = my_cholesky(sigma)  # 3x3xlen_
+    dtype = mathlib.float_dtype(sigma.dtype, is_complex=True)
+    c = my_cholesky(sigma.astype(dtype, copy=False), dtype='numpy')  # 3x3xlen_
     # generate complex gaussian distribution 
-    x = np.random.randn(3, ENL, len_) + 1j*np.random.randn(3, ENL, len_)
+    x = np.empty((3, ENL, len_), dtype=dtype)
+    x.real = np.random.randn(3, ENL, len_)
+    x.imag = np.random.randn(3, ENL, len_)
 
     # x = x.reshape(3*ENL, len_)
     # np.set_printoptions(precision=3)
@@ -1290,6 +3657,20 @@ if __name__=='__main__':
     cv2.imwrite(osp.join('./tmp', 'pauli.png'), cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
     print(t3)
 
+    ''' benchmark calibrate_GF3_L2() '''
+    # import timeit
+    # img = np.random.randint(1, 65535, size=(4, 8000, 8000)).astype(np.uint16)
+    # qualify_value = np.array([3.2, 2.1, 2.2, 3.1], dtype=np.float32)
+    # calibrate_const = np.array([32.1, 32.3, 32.2, 32.0], dtype=np.float32)
+    # def naive():
+    #     x = img.astype(np.float32)
+    #     x[x<mathlib.eps] = mathlib.eps
+    #     return 10*np.log10(x**2 * (qualify_value.reshape(-1, 1, 1)/65535)**2) - calibrate_const.reshape(-1, 1, 1)
+    # out = np.empty(img.shape, dtype=np.float32)
+    # print('naive: ', min(timeit.repeat(naive, number=1, repeat=3)))
+    # print('in place: ', min(timeit.repeat(lambda: calibrate_GF3_L2(img, qualify_value, calibrate_const, out=out), number=1, repeat=3)))
+    # print('max abs diff: ', np.abs(naive() - out).max())
+
     ''' test mat_mul_dot() '''
     # c1, c2, c3 = [], [], []
     # for ii in range(10):
@@ -11,6 +11,7 @@ import cv2
 import numpy as np
 
 from mylib import polSAR_utils as psr
+from mylib import mathlib
 
 
 def generate_Wishart_noise_from_img(img, ENL):
@@ -31,7 +32,7 @@ def generate_Wishart_noise_from_img(img, ENL):
 
 	# change to PolSAR's data format
 	img = img.reshape(-1, 3).transpose()
-	tmp = np.zeros((3, *img.shape), dtype=img.dtype)
+	tmp = np.zeros((3, *img.shape), dtype=mathlib.complex_dtype())
 	tmp[[0, 1, 2], [0, 1, 2], :] = img[:, :]
 
 	noise = psr.wishart_noise(tmp, ENL=ENL)
@@ -0,0 +1,66 @@
+'''
+Checks of the closed-form H/A/alpha decomposition against np.linalg.eigh(),
+on boxcar filtered and near-degenerate data
+'''
+
+import numpy as np
+import pytest
+
+# polSAR_utils imports torch at the module level
+pytest.importorskip('torch')
+
+from mylib import polSAR_utils as psr
+
+
+def eigh_HAalpha(t3):
+    ''' Reference H/A/alpha of T3 data in 'save_space' format '''
+    mat = psr.as_format(t3.astype(np.float64), 'complex_vector_9').reshape(3, 3, -1).transpose(2, 0, 1)
+    lams, vecs = np.linalg.eigh(mat)
+    lams = np.maximum(lams[:, ::-1], 0)
+    vecs = vecs[:, :, ::-1]
+    probs = lams / lams.sum(axis=1, keepdims=True)
+    entropy = -np.where(probs > 0, probs * np.log(np.where(probs > 0, probs, 1)), 0).sum(axis=1) / np.log(3)
+    anisotropy = (lams[:, 1] - lams[:, 2]) / (lams[:, 1] + lams[:, 2])
+    alpha = np.degrees((probs * np.arccos(np.abs(vecs[:, 0, :]))).sum(axis=1))
+    return np.stack([entropy, anisotropy, alpha]).reshape(3, *t3.shape[1:])
+
+
+def check_HAalpha(t3):
+    res = psr.HAalpha_decomposition(data=t3, src='T3', block_rows=32)
+    ref = eigh_HAalpha(t3)
+    np.testing.assert_allclose(res[0], ref[0], atol=1e-5)
+    np.testing.assert_allclose(res[1], ref[1], atol=1e-4)
+    np.testing.assert_allclose(res[2], ref[2], atol=1e-3)
+
+
+def test_filtered():
+    ''' multilooked data of high entropy has close eigenvalues '''
+    rng = np.random.default_rng(0)
+    s2 = (rng.standard_normal((4, 96, 128)) + 1j*rng.standard_normal((4, 96, 128))).astype(np.complex64)
+    s2[2] = s2[1]
+    t3 = psr.boxcar_filter(psr.s22t3(s2=s2), window=15)
+    check_HAalpha(t3)
+
+
+def test_near_degenerate():
+    ''' T3 of eigenvalues (1+delta, 1, 0.5) in random bases '''
+    rng = np.random.default_rng(1)
+    n = 4096
+    bases, _ = np.linalg.qr(rng.standard_normal((n, 3, 3)) + 1j*rng.standard_normal((n, 3, 3)))
+    delta = 10 ** rng.uniform(-4, -1, n)
+    lams = np.stack([1 + delta, np.ones(n), 0.5 * np.ones(n)], axis=1)
+    mat = np.einsum('nij,nj,nkj->nik', bases, lams, bases.conj())
+    t3 = psr.as_format(mat.transpose(1, 2, 0).reshape(9, 1, n).astype(np.complex64), 'save_space')
+    check_HAalpha(t3)
+
+
+def test_degenerate():
+    ''' the cos(alpha)^2 of a degenerate eigenspace goes to its first
+    eigenvector, e.g. alpha of the identity matrix is 60 degrees '''
+    t3 = np.zeros((9, 1, 4), dtype=np.float32)
+    t3[0] = [1, 1, 2, 1]
+    t3[5] = [1, 2, 1, 1]
+    t3[8] = [1, 2, 1, 0]
+    res = psr.HAalpha_decomposition(data=t3)
+    np.testing.assert_allclose(res[2, 0], [60, 72, 45, 45], atol=1e-4)
+    np.testing.assert_allclose(res[0, 0, 0], 1, atol=1e-6)
@@ -0,0 +1,95 @@
+'''
+Checks of the data types through read, convert, decompose, visualize and
+simulate under the single and double precision policies of mathlib
+'''
+
+import numpy as np
+import pytest
+
+# polSAR_utils imports torch at the module level
+pytest.importorskip('torch')
+
+from mylib import mathlib
+from mylib import polSAR_utils as psr
+
+
+policies = [('single', np.float32, np.complex64), ('double', np.float64, np.complex128)]
+
+
+@pytest.fixture(scope='module')
+def s2():
+    return np.random.default_rng(0).standard_normal((4, 16, 24)).astype(np.float32).view(np.complex64)
+
+
+@pytest.fixture(scope='module')
+def folders(s2, tmp_path_factory):
+    ''' s2, C3 and T3 folders written in single precision '''
+    root = tmp_path_factory.mktemp('polsar')
+    paths = dict()
+    for fmt in ('s2', 'C3', 'T3'):
+        (root/fmt).mkdir()
+        paths[fmt] = str(root/fmt)
+    c3 = psr.s22c3(s2=s2, out='save_space')
+    psr.write_s2(paths['s2'], s2)
+    psr.write_c3(paths['C3'], c3)
+    psr.write_t3(paths['T3'], psr.c32t3(c3=c3))
+    return paths
+
+
+@pytest.mark.parametrize('precision, real, cplx', policies)
+def test_read(folders, precision, real, cplx):
+    with mathlib.precision(precision):
+        assert psr.read_s2(folders['s2']).dtype == cplx
+        for read, fmt in ((psr.read_c3, 'C3'), (psr.read_t3, 'T3')):
+            assert read(folders[fmt], out='save_space').dtype == real
+            assert read(folders[fmt], out='complex_vector_6').dtype == cplx
+            assert read(folders[fmt], out='complex_vector_9', window=(1, 2, 5, 6)).dtype == cplx
+
+
+def test_read_cache(folders):
+    ''' the cached arrays of one precision are not served in the other '''
+    psr.enable_read_cache()
+    try:
+        for precision, real, _ in policies * 2:
+            with mathlib.precision(precision):
+                assert psr.read_c3(folders['C3'], out='save_space').dtype == real
+    finally:
+        psr.disable_read_cache()
+
+
+@pytest.mark.parametrize('precision, real, cplx', policies)
+def test_convert(s2, precision, real, cplx):
+    with mathlib.precision(precision):
+        c3 = psr.s22c3(s2=s2, out='save_space')
+        assert c3.dtype == real
+        assert psr.as_format(c3, 'complex_vector_9').dtype == cplx
+        assert psr.as_format(c3.astype(np.int16), 'complex_vector_6').dtype == cplx
+        assert psr.c32t3(c3=c3).dtype == real
+        assert psr.convert(c3, 'C3', 'T3', out='complex_vector_6', looks=2).dtype == cplx
+
+
+@pytest.mark.parametrize('precision, real, cplx', policies)
+def test_decompose(s2, precision, real, cplx):
+    with mathlib.precision(precision):
+        c3 = psr.s22c3(s2=s2, out='save_space')
+        hoekman = psr.Hokeman_decomposition(c3)
+        assert hoekman.dtype == real
+        assert psr.inverse_Hokeman_decomposition(hoekman).dtype == real
+        assert psr.HAalpha_decomposition(data=c3, src='C3').dtype == real
+
+
+@pytest.mark.parametrize('precision, real, cplx', policies)
+def test_visualize(s2, precision, real, cplx):
+    with mathlib.precision(precision):
+        c3 = psr.s22c3(s2=s2, out='save_space')
+        assert psr.rgb_by_c3(c3).dtype == real
+        _, _, normed = mathlib.norm_3_sigma(psr.as_format(c3, 'complex_vector_9'))
+        assert normed.dtype == cplx
+
+
+@pytest.mark.parametrize('precision, real, cplx', policies)
+def test_simulate(s2, precision, real, cplx):
+    with mathlib.precision(precision):
+        c3 = psr.s22c3(s2=s2, out='complex_vector_9')
+        noise = psr.wishart_noise(c3.reshape(3, 3, -1), ENL=3)
+        assert noise.dtype == cplx
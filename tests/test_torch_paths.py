@@ -0,0 +1,71 @@
+'''
+Checks of the torch paths of as_format(), convert() and the Hoekman
+decomposition against the numpy paths, on cpu tensors, tensors requiring
+grad, and cuda tensors if available
+'''
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from mylib import polSAR_utils as psr
+
+
+devices = ['cpu'] + (['cuda'] if torch.cuda.is_available() else [])
+
+
+def random_c3(shape=(2, 9, 8, 10), seed=0):
+    ''' Random C3 data in 'save_space' format, the conversions are linear,
+    so the data need not be positive semidefinite '''
+    return np.random.default_rng(seed).standard_normal(shape).astype(np.float32)
+
+
+@pytest.mark.parametrize('device', devices)
+@pytest.mark.parametrize('out', ['save_space', 'complex_vector_6', 'complex_vector_9'])
+def test_as_format(device, out):
+    c3 = random_c3()
+    ref = psr.as_format(c3, out=out)
+    res = psr.as_format(torch.from_numpy(c3).to(device), out=out)
+    assert res.device.type == device
+    np.testing.assert_allclose(res.cpu().numpy(), ref, rtol=1e-6)
+
+    # and back from the complex storage modes
+    back = psr.as_format(res, out='save_space')
+    np.testing.assert_allclose(back.cpu().numpy(), c3, rtol=1e-6)
+
+
+@pytest.mark.parametrize('device', devices)
+@pytest.mark.parametrize('src, dst', [('C3', 'T3'), ('T3', 'C3')])
+def test_convert(device, src, dst):
+    c3 = psr.as_format(random_c3(), out='complex_vector_6', channel_axis=1)
+    ref = psr.convert(c3, src, dst, out='complex_vector_9', looks=2)
+    res = psr.convert(torch.from_numpy(c3).to(device), src, dst, out='complex_vector_9', looks=2)
+    assert res.device.type == device
+    np.testing.assert_allclose(res.cpu().numpy(), ref, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('device', devices)
+def test_hoekman(device):
+    c3 = random_c3()
+    ref = psr.Hokeman_decomposition(c3, if_scale=True)
+    res = psr.Hokeman_decomposition(torch.from_numpy(c3).to(device), if_scale=True)
+    assert res.device.type == device
+    np.testing.assert_allclose(res.cpu().numpy(), ref, rtol=1e-5, atol=1e-5)
+
+    back = psr.inverse_Hokeman_decomposition(res, if_scale=True)
+    np.testing.assert_allclose(back.cpu().numpy(), c3, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize('device', devices)
+def test_requires_grad(device):
+    c3 = torch.from_numpy(random_c3()).to(device).requires_grad_()
+
+    t3 = psr.convert(c3, 'C3', 'T3', out='complex_vector_6')
+    hoekman = psr.Hokeman_decomposition(psr.as_format(t3, out='complex_vector_9'))
+    loss = t3.abs().sum() + hoekman.sum()
+    loss.backward()
+
+    assert c3.grad is not None
+    assert c3.grad.shape == c3.shape
+    assert torch.isfinite(c3.grad).all()
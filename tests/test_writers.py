@@ -0,0 +1,88 @@
+'''
+Checks of rewriting C3 and T3 scenes with the headers of their source,
+e.g. by split_patch() or PatchWriter
+'''
+
+import numpy as np
+import pytest
+
+# polSAR_utils imports torch at the module level
+pytest.importorskip('torch')
+
+from mylib import polSAR_utils as psr
+
+
+@pytest.fixture
+def c3():
+    s2 = np.random.default_rng(0).standard_normal((4, 37, 106)).astype(np.float32).view(np.complex64)
+    return psr.s22c3(s2=s2, out='save_space')
+
+
+@pytest.mark.parametrize('encoding', ['log_int16', 'float16'])
+def test_split_encoded(tmp_path, c3, encoding):
+    ''' the patches of an encoded scene are written in float32 '''
+    src = str(tmp_path/'C3')
+    psr.write_c3(src, c3, encoding=encoding)
+    decoded = psr.read_c3(src, out='save_space')
+    psr.split_patch(src, patch_size=[16, 32], num_workers=0)
+
+    for idx, (row0, col0) in enumerate([(0, 0), (0, 21), (16, 0), (16, 21), (21, 0), (21, 21)]):
+        patch_path = str(tmp_path/'C3'/str(idx))
+        meta_info = psr.read_hdr(patch_path)
+        assert meta_info['data type'] == '4'
+        assert 'polsar encoding' not in meta_info
+        patch = psr.read_c3(patch_path, out='save_space')
+        np.testing.assert_array_equal(patch, decoded[:, row0:row0+16, col0:col0+32])
+
+
+@pytest.mark.parametrize('encoding', ['log_int16', 'float16'])
+def test_rewrite_encoded_t3(tmp_path, c3, encoding):
+    src, dst = str(tmp_path/'src'), str(tmp_path/'dst')
+    (tmp_path/'src').mkdir()
+    (tmp_path/'dst').mkdir()
+    psr.write_t3(src, psr.c32t3(c3=c3), encoding=encoding)
+    decoded = psr.read_t3(src, out='save_space')
+    psr.write_t3(dst, decoded, psr.read_hdr(src, file='T11.bin'))
+    np.testing.assert_array_equal(psr.read_t3(dst, out='save_space'), decoded)
+
+
+def write_big_endian(path, data, bin_files, data_type, offset=8):
+    ''' Write a big-endian scene with a header offset '''
+    config = {'lines': str(data.shape[1]), 'samples': str(data.shape[2]),
+            'data type': '4', 'interleave': 'bsq', 'byte order': '1'}
+    psr.write_config_hdr(path, config, data_type=data_type)
+    for band, bin in zip(data, bin_files):
+        with open(f'{path}/{bin}.hdr', 'r') as f:
+            hdr = f.read().replace('header offset = 0', f'header offset = {offset}')
+        with open(f'{path}/{bin}.hdr', 'w') as f:
+            f.write(hdr)
+        with open(f'{path}/{bin}', 'wb') as f:
+            f.write(b'\0' * offset)
+            f.write(band.astype('>f4').tobytes())
+
+
+def test_rewrite_big_endian(tmp_path, c3):
+    ''' the rewritten bands and headers are in the native byte order '''
+    for fmt, data, bin_files, read, write in (
+            ('c3', c3, psr.c3_bin_files, psr.read_c3, psr.write_c3),
+            ('t3', psr.c32t3(c3=c3), psr.t3_bin_files, psr.read_t3, psr.write_t3)):
+        src, dst = tmp_path/f'{fmt}_src', tmp_path/f'{fmt}_dst'
+        src.mkdir()
+        dst.mkdir()
+        write_big_endian(str(src), data, bin_files, fmt)
+        np.testing.assert_array_equal(read(str(src), out='save_space'), data)
+
+        meta_info = psr.read_hdr(str(src), file=bin_files[0])
+        write(str(dst), read(str(src), out='save_space'), meta_info)
+        np.testing.assert_array_equal(read(str(dst), out='save_space'), data)
+        assert psr.read_hdr(str(dst), file=bin_files[0])['header offset'] == '0'
+
+
+def test_split_big_endian(tmp_path, c3):
+    src = tmp_path/'C3'
+    src.mkdir()
+    write_big_endian(str(src), c3, psr.c3_bin_files, 'c3')
+    psr.split_patch(str(src), patch_size=[16, 32], num_workers=2)
+    patch = psr.read_c3(str(src/'3'), out='save_space')
+    np.testing.assert_array_equal(patch, c3[:, 16:32, 21:53])
+    np.testing.assert_array_equal(np.stack(psr.memmap_c3(str(src/'3'))), c3[:, 16:32, 21:53])